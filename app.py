@@ -1,36 +1,165 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, g, request, jsonify, make_response
 from flask_cors import CORS
-from evaluator import determine_chatbot_preset, validate_score, get_user_metrics
+from batch_codec import BATCH_CONTENT_TYPE, RESULT_CONTENT_TYPE, decode_batch, encode_batch_result
+from evaluator import (
+    add_rule_table_check,
+    determine_chatbot_preset,
+    determine_chatbot_presets_batch,
+    determine_chatbot_presets_packed,
+    encode_chatbot_presets,
+    get_result_store,
+    get_rule_table,
+    load_presets_file,
+    validate_score,
+)
+from instrumentation import PROMETHEUS_CONTENT_TYPE, RequestMetrics, SlowRequestProfiler
+from log_config import configure_logging, debug_sampler_from_env
+from rate_limit import RateLimiter, SharedTokenBucketLimiter, TokenBucketLimiter, parse_rate_limits
+from result_store import BackgroundResultWriter
+from scoring import score_answers_batch, to_preset_metrics
+from sessions import (SESSION_TTL_SECONDS, SessionStore, SharedSessionStore, apply_answers, new_record,
+                      new_session_id, parse_session_id, record_answers, record_matches, record_missing,
+                      record_revision, validate_answers)
+from survey_stats import StatsPublisher, SurveyStats
+import atexit
+import json
 import logging
-import sys
+import math
+import os
+import threading
 import time
 from functools import wraps
 from datetime import datetime
+from werkzeug.exceptions import TooManyRequests
 
-# Configure logging with more detailed format
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
-    handlers=[
-        logging.FileHandler('api.log'),
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(f'api_{datetime.now().strftime("%Y%m%d")}.log')  # Daily log file
-    ]
-)
+# Logging is configured by the entry point (see __main__ below and server.py), not at import
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app with additional security headers
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+# Sampling and rate cap for the verbose header and payload dumps
+debug_sampler = debug_sampler_from_env()
+
+API_VERSION = '1.0.0'
+
+# Upper bound on surveys accepted by a single batch request
+MAX_BATCH_SIZE = 10000
+
+# Upper bound on surveys in a single binary batch, which costs far less per survey
+MAX_PACKED_BATCH_SIZE = 1000000
+
+# How long clients may reuse /api/metrics without revalidating
+METRICS_MAX_AGE = 60
+
+# Running aggregates for /api/stats
+survey_stats = SurveyStats(window_seconds=int(os.environ.get('SURVEY_STATS_WINDOW_SECONDS', '3600')))
+
+# Latency histograms, request and error counters and in-flight gauges for /metrics
+request_metrics = RequestMetrics()
+
+# Services that touch files or start threads, set up by init_app
+result_writer = None
+stats_publisher = None
+slow_request_profiler = None
+rate_limiter = None
+session_store = None
+_initialized = False
+_init_lock = threading.Lock()
+
+def init_app() -> Flask:
+    """
+    Start the services configured through the environment.
+
+    Loads and watches SURVEY_PRESETS_FILE, persists submissions under
+    SURVEY_RESULTS_DIR, shares statistics through SURVEY_STATS_DIR,
+    profiles slow requests when SURVEY_PROFILE_SAMPLE_RATE is set and
+    limits request rates per client when SURVEY_RATE_LIMITS is set. Keeps
+    survey sessions in memory or, with SURVEY_SESSION_FILE, in a table
+    shared by every worker. Runs once: entry points call it at startup,
+    otherwise the first request does, so importing this module opens no
+    files and starts no threads.
+
+    Returns:
+        Flask: The initialized app
+
+    Raises:
+        ValueError: If the presets file or rate limits cannot be loaded, or
+            the presets define more metrics than the session store holds
+    """
+    global result_writer, stats_publisher, slow_request_profiler, rate_limiter, session_store, _initialized
+    with _init_lock:
+        if _initialized:
+            return app
+
+        # Optionally serve presets from an external file, reloaded when it changes
+        if os.environ.get('SURVEY_PRESETS_FILE'):
+            load_presets_file(
+                os.environ['SURVEY_PRESETS_FILE'],
+                watch_interval=float(os.environ.get('SURVEY_PRESETS_RELOAD_INTERVAL', '5'))
+            )
+
+        # Persist submissions off the request path when a results directory is configured
+        if os.environ.get('SURVEY_RESULTS_DIR'):
+            result_writer = BackgroundResultWriter(get_result_store())
+
+        # Share aggregates between worker processes
+        if os.environ.get('SURVEY_STATS_DIR'):
+            stats_publisher = StatsPublisher(survey_stats, os.environ['SURVEY_STATS_DIR'])
+
+        # Optionally profile a sample of requests, keeping profiles of the slow ones
+        if float(os.environ.get('SURVEY_PROFILE_SAMPLE_RATE', '0')) > 0:
+            slow_request_profiler = SlowRequestProfiler(
+                os.environ.get('SURVEY_PROFILE_DIR', 'profiles'),
+                float(os.environ['SURVEY_PROFILE_SAMPLE_RATE']),
+                slow_ms=float(os.environ.get('SURVEY_PROFILE_SLOW_MS', '100'))
+            )
+
+        # Token buckets per client and route, optionally shared by every worker on the host
+        if os.environ.get('SURVEY_RATE_LIMITS'):
+            if os.environ.get('SURVEY_RATE_LIMIT_FILE'):
+                backend = SharedTokenBucketLimiter(os.environ['SURVEY_RATE_LIMIT_FILE'])
+            else:
+                backend = TokenBucketLimiter(max_keys=int(os.environ.get('SURVEY_RATE_LIMIT_MAX_CLIENTS', '100000')))
+            rate_limiter = RateLimiter(parse_rate_limits(os.environ['SURVEY_RATE_LIMITS']), backend)
+
+        # Partial answers of incremental surveys, optionally shared by every worker on the host
+        session_ttl = float(os.environ.get('SURVEY_SESSION_TTL_SECONDS', SESSION_TTL_SECONDS))
+        if os.environ.get('SURVEY_SESSION_FILE'):
+            session_store = SharedSessionStore(os.environ['SURVEY_SESSION_FILE'], ttl=session_ttl)
+        else:
+            session_store = SessionStore(int(os.environ.get('SURVEY_SESSION_MAX', '200000')), ttl=session_ttl)
+        # Refuse presets with more metrics than a session holds, now and on every reload
+        add_rule_table_check(session_store.check_table)
+
+        atexit.register(shutdown_services)
+        _initialized = True
+    return app
+
+def shutdown_services() -> None:
+    """
+    Write out queued results and fold this process's statistics into the
+    shared directory. Runs at exit; processes that leave through
+    ``os._exit`` call it themselves. Later calls do nothing.
+    """
+    global result_writer, stats_publisher
+    with _init_lock:
+        if result_writer is not None:
+            result_writer.close()
+            result_writer = None
+        if stats_publisher is not None:
+            stats_publisher.stop()
+            stats_publisher = None
+
 # Request logging middleware
 def log_request(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        request_start = time.time()
+        view_start = time.perf_counter_ns()
         response = f(*args, **kwargs)
-        request_duration = time.time() - request_start
-        logger.info(f"Request to {request.path} completed in {request_duration:.2f}s")
+        view_duration = request_metrics.end_view(view_start)
+        logger.info("Request to %s completed in %.3fms", request.path, view_duration / 1e6)
         return response
     return decorated_function
 
@@ -41,14 +170,16 @@ def handle_errors(f):
         try:
             return f(*args, **kwargs)
         except ValueError as ve:
-            logger.error(f"Validation error: {str(ve)}")
+            logger.error("Validation error: %s", ve)
+            request_metrics.count_error('ValidationError')
             return jsonify({
                 'success': False,
                 'error': str(ve),
                 'error_type': 'ValidationError'
             }), 400
         except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+            logger.error("Unexpected error: %s", e, exc_info=True)
+            request_metrics.count_error('ServerError')
             return jsonify({
                 'success': False,
                 'error': "An unexpected error occurred",
@@ -56,13 +187,40 @@ def handle_errors(f):
             }), 500
     return decorated_function
 
+@app.before_request
+def ensure_initialized():
+    """Run init_app on the first request if the entry point did not"""
+    if not _initialized:
+        init_app()
+
+@app.before_request
+def start_instrumentation():
+    """Start timing the request, and profiling it if sampled"""
+    rule = request.url_rule
+    request_metrics.start_request(rule.rule if rule is not None else 'unmatched')
+    if slow_request_profiler is not None:
+        g.profile = slow_request_profiler.start()
+
+@app.before_request
+def enforce_rate_limit():
+    """Refuse requests over the client's limit for the route"""
+    if rate_limiter is None:
+        return
+    rule = request.url_rule
+    retry_after = rate_limiter.check(rule.rule if rule is not None else 'unmatched', request.remote_addr or '')
+    if retry_after:
+        raise TooManyRequests(retry_after=math.ceil(retry_after))
+
 @app.before_request
 def before_request():
     """Log incoming request details"""
-    logger.debug(f"Incoming {request.method} request to {request.path}")
-    logger.debug(f"Request headers: {dict(request.headers)}")
-    if request.data:
-        logger.debug(f"Request payload: {request.get_json(silent=True)}")
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug("Incoming %s request to %s", request.method, request.path)
+    if debug_sampler.allow():
+        logger.debug("Request headers: %s", dict(request.headers))
+        if request.data:
+            logger.debug("Request payload: %s", request.get_json(silent=True))
 
 @app.after_request
 def after_request(response):
@@ -70,19 +228,59 @@ def after_request(response):
     response.headers['X-Content-Type-Options'] = 'nosniff'
     response.headers['X-Frame-Options'] = 'DENY'
     response.headers['X-XSS-Protection'] = '1; mode=block'
-    logger.debug(f"Response status: {response.status}")
+    request_metrics.set_status(response.status_code)
+    logger.debug("Response status: %s", response.status)
     return response
 
+@app.teardown_request
+def finish_instrumentation(exc):
+    """Record the request's latency and status, and keep its profile if it was slow"""
+    elapsed = request_metrics.finish_request()
+    if slow_request_profiler is not None and g.get('profile') is not None:
+        rule = request.url_rule
+        slow_request_profiler.finish(g.profile, rule.rule if rule is not None else 'unmatched', elapsed)
+
+def encode_json(data) -> bytes:
+    """Encode data the way jsonify does (sorted keys, compact separators)"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+def cacheable_json(body: bytes, etag: str, max_age: int = 0, weak: bool = False):
+    """
+    Build a JSON response with an ETag, answering a matching If-None-Match
+    with 304 Not Modified. Without ``max_age`` clients must revalidate
+    every time.
+    """
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag, weak=weak)
+    if max_age:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def survey_result_body(user_metrics: dict, presets_json: bytes) -> bytes:
+    """Encode a scored survey response, assembled in jsonify's sorted key order"""
+    return b''.join((
+        b'{"metrics":', encode_json(user_metrics),
+        b',"percentile_ranks":', encode_json(survey_stats.percentile_ranks(user_metrics)),
+        b',"presets":', presets_json,
+        b',"success":true,"timestamp":', encode_json(datetime.now().isoformat()),
+        b'}\n'
+    ))
+
 @app.route('/health', methods=['GET'])
 @log_request
 def health_check():
     """Health check endpoint to verify API is running"""
-    return jsonify({
+    body = encode_json({
         'status': 'healthy',
         'message': 'API is running',
         'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
-    })
+        'version': API_VERSION
+    }) + b'\n'
+    # Only the timestamp varies while healthy, so a weak validator applies
+    return cacheable_json(body, f'healthy-{API_VERSION}', weak=True)
 
 @app.route('/api/process-survey', methods=['POST'])
 @log_request
@@ -98,62 +296,455 @@ def process_survey():
         "metric_c": score (0-100)
     }
     """
-    if not request.is_json:
-        raise ValueError("Request must contain JSON data")
-
-    user_metrics = request.json
-    logger.info(f"Received survey metrics: {user_metrics}")
-
-    # Validate required metrics are present and their types
-    required_metrics = ['metric_a', 'metric_b', 'metric_c']
-    for metric in required_metrics:
-        if metric not in user_metrics:
-            raise ValueError(f"Missing required metric: {metric}")
-        
-        if not isinstance(user_metrics[metric], (int, float)):
-            raise ValueError(f"Invalid type for {metric}. Must be numeric")
-            
-        # Validate score ranges
-        if not validate_score(user_metrics[metric]):
-            raise ValueError(f"Invalid score for {metric}. Must be between 0-100")
-
-    # Process survey and get recommended presets
-    chatbot_presets = determine_chatbot_preset(user_metrics)
-    logger.info(f"Determined presets: {chatbot_presets}")
-
-    response_data = {
-        'success': True,
-        'presets': chatbot_presets,
-        'metrics': user_metrics,
-        'timestamp': datetime.now().isoformat()
+    with request_metrics.stage('parse'):
+        if not request.is_json:
+            raise ValueError("Request must contain JSON data")
+        user_metrics = request.json
+
+    logger.info("Received survey metrics: %s", user_metrics)
+    with request_metrics.stage('validate'):
+        if not isinstance(user_metrics, dict):
+            raise ValueError("Request body must map each metric to a score")
+        table = get_rule_table()
+
+        # Validate required metrics are present
+        for metric in table.required:
+            if metric not in user_metrics:
+                raise ValueError(f"Missing required metric: {metric}")
+
+        # Validate every submitted metric is known and its score type and range
+        for metric, score in user_metrics.items():
+            if metric not in table:
+                raise ValueError(f"Unknown metric: {metric}")
+
+            if not isinstance(score, (int, float)):
+                raise ValueError(f"Invalid type for {metric}. Must be numeric")
+
+            # Validate score ranges
+            if not validate_score(score):
+                raise ValueError(f"Invalid score for {metric}. Must be between 0-100")
+
+    # Process survey and encode the recommended presets from precomputed fragments
+    with request_metrics.stage('evaluate'):
+        presets_json = encode_chatbot_presets(user_metrics, table)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Determined presets: %s", presets_json.decode('utf-8'))
+    with request_metrics.stage('record'):
+        if result_writer is not None:
+            result_writer.submit(user_metrics, determine_chatbot_preset(user_metrics, table))
+        survey_stats.record(user_metrics, table)
+
+    with request_metrics.stage('serialize'):
+        return app.response_class(survey_result_body(user_metrics, presets_json), mimetype='application/json')
+
+@app.route('/api/process-survey/batch', methods=['POST'])
+@log_request
+@handle_errors
+def process_survey_batch():
+    """
+    Process many surveys in one request and return presets for each of them
+
+    Expected request body, one array per metric with one score per survey:
+    {
+        "metric_a": [score (0-100), ...],
+        "metric_b": [score (0-100), ...],
+        "metric_c": [score (0-100), ...]
+    }
+
+    Invalid scores are reported per survey in ``results`` without failing
+    the rest of the batch.
+
+    Bulk uploads can instead send a binary batch (Content-Type
+    application/x-survey-batch, see batch_codec), answered in JSON or, if
+    the client accepts it, as a binary result.
+    """
+    if request.mimetype == BATCH_CONTENT_TYPE:
+        return process_packed_batch()
+
+    with request_metrics.stage('parse'):
+        if not request.is_json:
+            raise ValueError("Request must contain JSON data")
+        metric_columns = request.json
+
+    with request_metrics.stage('validate'):
+        if not isinstance(metric_columns, dict):
+            raise ValueError("Request body must map each metric to an array of scores")
+        table = get_rule_table()
+
+        for metric in table.required:
+            if metric not in metric_columns:
+                raise ValueError(f"Missing required metric: {metric}")
+
+        for metric, scores in metric_columns.items():
+            if metric not in table:
+                raise ValueError(f"Unknown metric: {metric}")
+            if not isinstance(scores, list):
+                raise ValueError(f"Invalid type for {metric}. Must be an array of scores")
+            if len(scores) > MAX_BATCH_SIZE:
+                raise ValueError(f"Batch too large. At most {MAX_BATCH_SIZE} surveys per request")
+
+    with request_metrics.stage('evaluate'):
+        results = determine_chatbot_presets_batch(metric_columns, table)
+    error_count = sum(1 for result in results if not result['success'])
+    with request_metrics.stage('record'):
+        for row, result in enumerate(results):
+            if result['success']:
+                row_metrics = {
+                    metric: scores[row] for metric, scores in metric_columns.items() if scores[row] is not None
+                }
+                survey_stats.record(row_metrics, table)
+                if result_writer is not None:
+                    result_writer.submit(row_metrics, result['presets'])
+    logger.info("Processed batch of %s surveys (%s rejected)", len(results), error_count)
+
+    with request_metrics.stage('serialize'):
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'error_count': error_count,
+            'results': results,
+            'timestamp': datetime.now().isoformat()
+        })
+
+def process_packed_batch():
+    """Score a binary batch, answering with a binary result when the client accepts one"""
+    with request_metrics.stage('parse'):
+        batch = decode_batch(request.get_data(cache=False))
+
+    with request_metrics.stage('validate'):
+        if batch.row_count > MAX_PACKED_BATCH_SIZE:
+            raise ValueError(f"Batch too large. At most {MAX_PACKED_BATCH_SIZE} surveys per request")
+        table = get_rule_table()
+        for metric in table.required:
+            if metric not in batch.metrics:
+                raise ValueError(f"Missing required metric: {metric}")
+        for metric in batch.metrics:
+            if metric not in table:
+                raise ValueError(f"Unknown metric: {metric}")
+
+    with request_metrics.stage('evaluate'):
+        outcome = determine_chatbot_presets_packed(batch, table)
+    error_count = len(outcome.row_errors)
+    binary = request.accept_mimetypes.best_match(['application/json', RESULT_CONTENT_TYPE]) == RESULT_CONTENT_TYPE
+    # Per-survey results are built once, and only if the response or the result store needs them
+    results = outcome.results(table) if result_writer is not None or not binary else None
+    with request_metrics.stage('record'):
+        survey_stats.record_packed(outcome.columns, outcome.hits, batch.row_count - error_count)
+        if result_writer is not None:
+            for row, result in enumerate(results):
+                if result['success']:
+                    result_writer.submit(outcome.row_metrics(row), result['presets'])
+    logger.info("Processed packed batch of %s surveys (%s rejected)", batch.row_count, error_count)
+
+    with request_metrics.stage('serialize'):
+        if binary:
+            body = encode_batch_result(len(batch.metrics), outcome.statuses, outcome.masks)
+            return app.response_class(body, mimetype=RESULT_CONTENT_TYPE)
+        return jsonify({
+            'success': True,
+            'count': batch.row_count,
+            'error_count': error_count,
+            'results': results,
+            'timestamp': datetime.now().isoformat()
+        })
+
+@app.route('/api/score-answers', methods=['POST'])
+@log_request
+@handle_errors
+def score_survey_answers():
+    """
+    Score raw survey answers on the server and return recommended chatbot presets
+
+    Expected request body, either one survey's answers:
+    {
+        "llm_familiarity": 1-5,
+        "llm_experience": "yes" | "no",
+        "cross_check_frequency": 1-5,
+        "info_characteristics": ["accuracy", ...]
+    }
+    or many of them as {"answers": [{...}, ...]}, which returns one result
+    per survey and reports invalid answers per survey.
+    """
+    with request_metrics.stage('parse'):
+        if not request.is_json:
+            raise ValueError("Request must contain JSON data")
+        body = request.json
+
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be an object of survey answers")
+    is_batch = 'answers' in body
+    answers = body['answers'] if is_batch else [body]
+    if not isinstance(answers, list):
+        raise ValueError("answers must be an array of survey answers")
+    if len(answers) > MAX_BATCH_SIZE:
+        raise ValueError(f"Batch too large. At most {MAX_BATCH_SIZE} surveys per request")
+
+    table = get_rule_table()
+    with request_metrics.stage('score'):
+        results = score_answers_batch(answers)
+        scored = [result for result in results if result['success']]
+        preset_metrics = [to_preset_metrics(result['scores']) for result in scored]
+    mapped = preset_metrics[0] if preset_metrics else {}
+    metric_columns = {
+        metric: [metrics[metric] for metrics in preset_metrics]
+        for metric in table.keys if metric in mapped
+    }
+    with request_metrics.stage('evaluate'):
+        for result, metrics, presets in zip(scored, preset_metrics,
+                                            determine_chatbot_presets_batch(metric_columns, table)):
+            result['metrics'] = metrics
+            result['presets'] = presets['presets']
+
+    if not is_batch:
+        if not results[0]['success']:
+            raise ValueError(results[0]['error'])
+        result = results[0]
+        with request_metrics.stage('serialize'):
+            return jsonify({
+                'success': True,
+                'scores': result['scores'],
+                'metrics': result['metrics'],
+                'presets': result['presets'],
+                'timestamp': datetime.now().isoformat()
+            })
+
+    with request_metrics.stage('serialize'):
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'error_count': len(results) - len(scored),
+            'results': results,
+            'timestamp': datetime.now().isoformat()
+        })
+
+def session_not_found():
+    """Respond that a session does not exist, has expired or no longer matches the presets"""
+    request_metrics.count_error('SessionNotFoundError')
+    return jsonify({
+        'success': False,
+        'error': 'Session not found or expired',
+        'error_type': 'SessionNotFoundError'
+    }), 404
+
+def session_response(session_id: str, record: bytes, table, changed=None, status: int = 200):
+    """
+    Encode a session's state in jsonify's sorted key order: every selected
+    preset, or with ``changed`` only the presets that update changed, null
+    for those no longer selected.
+    """
+    missing = record_missing(record, table)
+    answers = record_answers(record, table)
+    if changed is None:
+        presets = b',"presets":' + table.encode_presets(answers)
+        changed_json = b''
+    else:
+        presets = b''
+        changed_json = b'"changed":{' + b','.join(
+            encode_json(metric) + b':' + (fragment if fragment is not None else b'null')
+            for metric, fragment in changed.items()
+        ) + b'},'
+    body = b''.join((
+        b'{', changed_json,
+        b'"complete":', b'false' if missing else b'true',
+        b',"metrics":', encode_json(answers),
+        b',"missing":', encode_json(missing),
+        presets,
+        b',"revision":', str(record_revision(record)).encode('ascii'),
+        b',"session_id":', encode_json(session_id),
+        b',"success":true}\n'
+    ))
+    return app.response_class(body, status=status, mimetype='application/json')
+
+def read_answers(table) -> dict:
+    """Parse and validate the answers in the request body, which may be empty"""
+    with request_metrics.stage('parse'):
+        if not request.data:
+            return {}
+        if not request.is_json:
+            raise ValueError("Request must contain JSON data")
+        answers = request.json
+    with request_metrics.stage('validate'):
+        return validate_answers(answers, table)
+
+@app.route('/api/sessions', methods=['POST'])
+@log_request
+@handle_errors
+def create_session():
+    """
+    Start a survey session for submitting answers one at a time
+
+    Optional request body with the answers given so far:
+    {
+        "metric_a": score (0-100),
+        ...
     }
+    """
+    table = get_rule_table()
+    answers = read_answers(table)
+    with request_metrics.stage('evaluate'):
+        record = new_record(table)
+        apply_answers(record, answers, table)
+    session_id = new_session_id()
+    with request_metrics.stage('record'):
+        session_store.create(parse_session_id(session_id), record)
+    with request_metrics.stage('serialize'):
+        return session_response(session_id, record, table, status=201)
 
-    return jsonify(response_data)
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+@log_request
+@handle_errors
+def get_session(session_id):
+    """Return a session's answers and every preset they select"""
+    key = parse_session_id(session_id)
+    record = session_store.snapshot(key) if key is not None else None
+    table = get_rule_table()
+    if record is None or not record_matches(record, table):
+        return session_not_found()
+    with request_metrics.stage('serialize'):
+        return session_response(session_id, record, table)
+
+@app.route('/api/sessions/<session_id>', methods=['PATCH'])
+@log_request
+@handle_errors
+def update_session(session_id):
+    """
+    Add, change or withdraw (null) answers and return the presets that changed
+
+    Expected request body, any subset of the metrics:
+    {
+        "metric_b": score (0-100) or null
+    }
+    """
+    key = parse_session_id(session_id)
+    if key is None:
+        return session_not_found()
+    table = get_rule_table()
+    answers = read_answers(table)
+
+    def update(record):
+        if not record_matches(record, table):
+            return None
+        return apply_answers(record, answers, table), bytes(record)
+
+    with request_metrics.stage('evaluate'):
+        updated = session_store.modify(key, update)
+    if updated is None:
+        return session_not_found()
+    changed, record = updated
+    with request_metrics.stage('serialize'):
+        return session_response(session_id, record, table, changed)
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+@log_request
+@handle_errors
+def delete_session(session_id):
+    """Discard a session"""
+    key = parse_session_id(session_id)
+    if key is None or session_store.delete(key) is None:
+        return session_not_found()
+    return jsonify({'success': True})
+
+@app.route('/api/sessions/<session_id>/submit', methods=['POST'])
+@log_request
+@handle_errors
+def submit_session(session_id):
+    """
+    Score a session whose required metrics are all answered, as
+    /api/process-survey would, and close it
+    """
+    key = parse_session_id(session_id)
+    if key is None:
+        return session_not_found()
+    table = get_rule_table()
+
+    def complete(record):
+        return record_matches(record, table) and not record_missing(record, table)
+
+    with request_metrics.stage('validate'):
+        # Checked and closed in one step, so no concurrent update slips in
+        # between and a session is never scored twice
+        popped = session_store.pop_if(key, complete)
+        if popped is None or not record_matches(popped[1], table):
+            return session_not_found()
+        closed, record = popped
+        if not closed:
+            raise ValueError(f"Missing required metric: {record_missing(record, table)[0]}")
+
+    user_metrics = record_answers(record, table)
+    with request_metrics.stage('evaluate'):
+        presets_json = encode_chatbot_presets(user_metrics, table)
+    with request_metrics.stage('record'):
+        if result_writer is not None:
+            result_writer.submit(user_metrics, determine_chatbot_preset(user_metrics, table))
+        survey_stats.record(user_metrics, table)
+    with request_metrics.stage('serialize'):
+        return app.response_class(survey_result_body(user_metrics, presets_json), mimetype='application/json')
+
+# Encoded /api/metrics body and the rule table version it describes
+_metrics_body = ('', b'')
 
 @app.route('/api/metrics', methods=['GET'])
 @log_request
 @handle_errors
 def get_metrics():
-    """Get available metrics and their descriptions"""
-    metrics = get_user_metrics()
+    """
+    Get available metrics and their descriptions
+
+    The body only changes when presets are reloaded, so it is encoded once
+    per rule table version and served with an ETag for revalidation.
+    """
+    global _metrics_body
+    table = get_rule_table()
+    version, body = _metrics_body
+    if version != table.version:
+        body = encode_json({
+            'success': True,
+            'metrics': table.describe(),
+            'version': table.version,
+            'timestamp': table.loaded_at
+        }) + b'\n'
+        _metrics_body = (table.version, body)
+    return cacheable_json(body, f'metrics-{table.version}', max_age=METRICS_MAX_AGE)
+
+@app.route('/api/stats', methods=['GET'])
+@log_request
+@handle_errors
+def get_stats():
+    """
+    Get preset hit rates and score quantiles for every metric, all-time and
+    for the most recent time windows (``?windows=N``, default 24)
+    """
+    window_count = request.args.get('windows', 24, type=int)
+    stats = stats_publisher.merged() if stats_publisher is not None else survey_stats
+    summary = stats.summary(get_rule_table(), window_count)
     return jsonify({
         'success': True,
-        'metrics': metrics,
+        **summary,
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request latency histograms, counters and in-flight gauges in the Prometheus text format"""
+    return app.response_class(request_metrics.render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
 # Add rate limiting
 @app.errorhandler(429)
 def ratelimit_handler(e):
-    return jsonify({
+    request_metrics.count_error('RateLimitError')
+    response = jsonify({
         'success': False,
         'error': 'Rate limit exceeded',
         'error_type': 'RateLimitError'
-    }), 429
+    })
+    if getattr(e, 'retry_after', None):
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
 
 # Add 404 handler
 @app.errorhandler(404)
 def not_found_error(e):
+    request_metrics.count_error('NotFoundError')
     return jsonify({
         'success': False,
         'error': 'Resource not found',
@@ -161,6 +752,9 @@ def not_found_error(e):
     }), 404
 
 if __name__ == '__main__':
+    # SURVEY_LOG_MODE=async moves log disk I/O off the request path
+    configure_logging()
+    init_app()
     logger.info("Starting Survey Calculator API...")
     logger.info(f"Debug mode: {app.debug}")
     logger.info(f"CORS enabled for /api/* endpoints")
@@ -0,0 +1,176 @@
+"""
+Compact binary format for bulk survey submissions and their results.
+
+Every score is an integer from 0 to 100, so a batch is sent as a short
+header naming the metrics followed by one byte per score, row by row. The
+server decodes it without creating a Python object per score: the scores
+stay in the request buffer and each metric's column is a strided
+``memoryview`` over it.
+
+Batch (``application/x-survey-batch``), integers little-endian::
+
+    b'SVBT' | version: u8 | metric count M: u8
+    | M x (key length: u8, key: ASCII) | row count N: u32
+    | N x M scores: u8, row by row; 0xFF marks an unanswered optional metric
+
+Result (``application/x-survey-batch-result``)::
+
+    b'SVBR' | version: u8 | metric count M: u8 | row count N: u32
+    | N x status: u8 (0 ok, 1 invalid score, 2 missing required score)
+    | N x W preset masks, W = ceil(M / 8) bytes per row; bit i (byte i // 8,
+      bit i % 8) is set when the row's score for the batch's i-th metric
+      met its threshold
+"""
+import struct
+from typing import Iterable, Optional, Sequence, Tuple
+
+BATCH_CONTENT_TYPE = 'application/x-survey-batch'
+RESULT_CONTENT_TYPE = 'application/x-survey-batch-result'
+
+BATCH_MAGIC = b'SVBT'
+RESULT_MAGIC = b'SVBR'
+FORMAT_VERSION = 1
+
+# Score byte for an optional metric the survey did not answer
+MISSING_SCORE = 0xFF
+
+# Row status codes in a result
+ROW_OK = 0
+ROW_INVALID_SCORE = 1
+ROW_MISSING_SCORE = 2
+
+_PREAMBLE = struct.Struct('<4sBB')  # magic, version, metric count
+_ROW_COUNT = struct.Struct('<I')
+_RESULT_HEADER = struct.Struct('<4sBBI')  # magic, version, metric count, row count
+
+class BatchFormatError(ValueError):
+    """Raised when a binary batch or result is malformed"""
+    pass
+
+class PackedBatch:
+    """
+    Decoded binary batch: metric keys and a zero-copy view of the scores.
+
+    ``scores`` is a row-major ``memoryview`` of ``row_count`` x
+    ``len(metrics)`` bytes over the original buffer.
+    """
+    __slots__ = ('metrics', 'row_count', 'scores')
+
+    def __init__(self, metrics: Tuple[str, ...], row_count: int, scores: memoryview):
+        self.metrics = metrics
+        self.row_count = row_count
+        self.scores = scores
+
+    def column(self, position: int) -> memoryview:
+        """Return a strided view of the scores of the metric at ``position``"""
+        return self.scores[position::len(self.metrics)]
+
+def mask_width(metric_count: int) -> int:
+    """Bytes per row of preset mask for ``metric_count`` metrics"""
+    return (metric_count + 7) // 8
+
+def encode_batch(metrics: Sequence[str], rows: Iterable[Sequence[Optional[int]]]) -> bytes:
+    """
+    Encode surveys as a binary batch.
+
+    Args:
+        metrics (Sequence[str]): Metric keys, in the order scores are given
+        rows (Iterable[Sequence[Optional[int]]]): One sequence of scores per
+            survey; None marks an unanswered optional metric
+
+    Returns:
+        bytes: The encoded batch
+
+    Raises:
+        BatchFormatError: If there are too many metrics, a key is too long
+            or a row has the wrong number of scores
+    """
+    if not 0 < len(metrics) < 256:
+        raise BatchFormatError("A batch must have between 1 and 255 metrics")
+    header = bytearray(_PREAMBLE.pack(BATCH_MAGIC, FORMAT_VERSION, len(metrics)))
+    for metric in metrics:
+        key = metric.encode('ascii')
+        if len(key) > 255:
+            raise BatchFormatError(f"Metric key too long: {metric}")
+        header += bytes((len(key),)) + key
+
+    scores = bytearray()
+    row_count = 0
+    for row in rows:
+        if len(row) != len(metrics):
+            raise BatchFormatError(f"Row {row_count} has {len(row)} scores, expected {len(metrics)}")
+        scores += bytes(MISSING_SCORE if score is None else score for score in row)
+        row_count += 1
+    return bytes(header + _ROW_COUNT.pack(row_count) + scores)
+
+def decode_batch(data: bytes) -> PackedBatch:
+    """
+    Decode a binary batch without copying its scores.
+
+    Raises:
+        BatchFormatError: If the header is malformed or the score block
+            does not match the row count
+    """
+    view = memoryview(data)
+    if len(view) < _PREAMBLE.size:
+        raise BatchFormatError("Truncated batch header")
+    magic, version, metric_count = _PREAMBLE.unpack_from(view)
+    if magic != BATCH_MAGIC:
+        raise BatchFormatError("Not a survey batch")
+    if version != FORMAT_VERSION:
+        raise BatchFormatError(f"Unsupported batch format version {version}")
+    if metric_count == 0:
+        raise BatchFormatError("A batch must name at least one metric")
+
+    offset = _PREAMBLE.size
+    metrics = []
+    for _ in range(metric_count):
+        if offset >= len(view):
+            raise BatchFormatError("Truncated batch header")
+        length = view[offset]
+        key = bytes(view[offset + 1:offset + 1 + length])
+        if len(key) != length:
+            raise BatchFormatError("Truncated batch header")
+        try:
+            metrics.append(key.decode('ascii'))
+        except UnicodeDecodeError:
+            raise BatchFormatError("Metric keys must be ASCII")
+        offset += 1 + length
+    if len(set(metrics)) != len(metrics):
+        raise BatchFormatError("Duplicate metric in batch header")
+
+    if offset + _ROW_COUNT.size > len(view):
+        raise BatchFormatError("Truncated batch header")
+    row_count, = _ROW_COUNT.unpack_from(view, offset)
+    offset += _ROW_COUNT.size
+    if len(view) - offset != row_count * metric_count:
+        raise BatchFormatError(
+            f"Expected {row_count * metric_count} score bytes for {row_count} rows, got {len(view) - offset}"
+        )
+    return PackedBatch(tuple(metrics), row_count, view[offset:])
+
+def encode_batch_result(metric_count: int, statuses: bytes, masks: bytes) -> bytes:
+    """Encode per-row statuses and preset masks as a binary result"""
+    return _RESULT_HEADER.pack(RESULT_MAGIC, FORMAT_VERSION, metric_count, len(statuses)) + statuses + masks
+
+def decode_batch_result(data: bytes) -> Tuple[int, memoryview, memoryview]:
+    """
+    Decode a binary result.
+
+    Returns:
+        Tuple[int, memoryview, memoryview]: Metric count, one status byte
+        per row and the row-major preset masks
+
+    Raises:
+        BatchFormatError: If the result is malformed
+    """
+    view = memoryview(data)
+    if len(view) < _RESULT_HEADER.size:
+        raise BatchFormatError("Truncated result header")
+    magic, version, metric_count, row_count = _RESULT_HEADER.unpack_from(view)
+    if magic != RESULT_MAGIC or version != FORMAT_VERSION:
+        raise BatchFormatError("Not a survey batch result")
+    statuses_end = _RESULT_HEADER.size + row_count
+    if len(view) != statuses_end + row_count * mask_width(metric_count):
+        raise BatchFormatError("Result length does not match its row count")
+    return metric_count, view[_RESULT_HEADER.size:statuses_end], view[statuses_end:]
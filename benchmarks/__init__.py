@@ -0,0 +1,6 @@
+"""
+Benchmarks for the Survey Calculator API and evaluator.
+
+Run ``python -m benchmarks run`` for the micro-benchmark and load suites
+and ``python -m benchmarks compare`` to check results against a baseline.
+"""
@@ -0,0 +1,151 @@
+"""
+Run the benchmark suite or compare two result files.
+
+Usage:
+    python -m benchmarks run [--suite micro] [--suite load] [--suite startup]
+                             [--transport localhost] [--output results.json]
+                             [--baseline baseline.json]
+    python -m benchmarks compare baseline.json results.json [--threshold 0.10]
+    python -m benchmarks startup [--budget import_app=800]
+
+``compare``, and ``run`` with ``--baseline``, exit with status 1 when any
+measurement regressed by more than the threshold. ``startup`` exits with
+status 1 when a cold start is over budget or an import leaves files behind.
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.results import compare, load_results, write_results
+
+def print_results(results: Dict[str, Dict[str, float]]) -> None:
+    micro = {name: result for name, result in results.items() if 'ns_per_op' in result}
+    load = {name: result for name, result in results.items() if 'rps' in result}
+    startup = {name: result for name, result in results.items() if 'median_ms' in result}
+    if micro:
+        print(f"{'benchmark':<48}{'ns/op':>14}{'best ns/op':>14}")
+        for name, result in micro.items():
+            print(f"{name:<48}{result['ns_per_op']:>14,.0f}{result['best_ns_per_op']:>14,.0f}")
+    if load:
+        if micro:
+            print()
+        print(f"{'benchmark':<48}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for name, result in load.items():
+            print(f"{name:<48}{result['rps']:>10,.0f}{result['p50_ms']:>9.2f}"
+                  f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['errors']:>8}")
+    if startup:
+        if micro or load:
+            print()
+        print(f"{'benchmark':<48}{'ms':>10}{'best ms':>10}{'files':>8}")
+        for name, result in startup.items():
+            print(f"{name:<48}{result['median_ms']:>10.1f}{result['best_ms']:>10.1f}{result['files_created']:>8}")
+
+def print_comparison(rows: List[Dict[str, Any]], threshold: float) -> int:
+    """Print the comparison and return the number of regressions"""
+    print(f"{'benchmark':<48}{'measure':<12}{'baseline':>12}{'current':>12}{'change':>9}")
+    for row in rows:
+        change = f"{row['change'] * 100:+.1f}%" if row['change'] is not None else 'n/a'
+        flag = '  REGRESSION' if row['regression'] else ''
+        print(f"{row['benchmark']:<48}{row['measure']:<12}{row['baseline']:>12,.2f}"
+              f"{row['current']:>12,.2f}{change:>9}{flag}")
+    regressions = sum(row['regression'] for row in rows)
+    print(f"\n{regressions} regressions beyond {threshold * 100:g}% in {len(rows)} measurements")
+    return regressions
+
+def run(args: argparse.Namespace) -> int:
+    from benchmarks.load import run_load
+    from benchmarks.micro import run_micro
+    from benchmarks.startup import run_startup
+    from log_config import configure_logging, shutdown_logging
+
+    suites = args.suite or ['micro', 'load', 'startup']
+    results: Dict[str, Dict[str, float]] = {}
+    if 'startup' in suites:
+        results.update(run_startup(args.startup_runs, args.only))
+    with tempfile.TemporaryDirectory() as log_dir:
+        configure_logging(mode=args.log_mode, level=args.log_level, log_dir=log_dir, console=False)
+        try:
+            if 'micro' in suites:
+                results.update(run_micro(args.rounds, args.only))
+            if 'load' in suites:
+                results.update(run_load(args.transport, args.concurrency, args.requests, args.url, args.only))
+        finally:
+            shutdown_logging()
+
+    print_results(results)
+    settings = {key: value for key, value in vars(args).items() if key not in ('command', 'baseline', 'output')}
+    document = write_results(args.output, results, settings)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        print()
+        rows = compare(load_results(args.baseline), document, args.threshold)
+        return 1 if print_comparison(rows, args.threshold) else 0
+    return 0
+
+def check_startup(args: argparse.Namespace) -> int:
+    from benchmarks.startup import STARTUP_BUDGET_MS, check_budget, run_startup
+
+    budget = dict(STARTUP_BUDGET_MS)
+    for item in args.budget:
+        scenario, _, limit = item.partition('=')
+        if scenario not in budget or not limit:
+            raise SystemExit(f"Invalid budget {item!r}, expected one of {', '.join(budget)}=MS")
+        budget[scenario] = float(limit)
+
+    results = run_startup(args.runs)
+    print_results(results)
+    violations = check_budget(results, budget)
+    for violation in violations:
+        print(f"OVER BUDGET: {violation}")
+    if not violations:
+        print("\nStartup within budget")
+    return 1 if violations else 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description="Benchmark the Survey Calculator API and evaluator.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run benchmarks and save the results")
+    run_parser.add_argument('--suite', action='append', choices=('micro', 'load', 'startup'),
+                            help="Suite to run, repeatable (default: all)")
+    run_parser.add_argument('--only', default='', help="Only run benchmarks whose name contains this")
+    run_parser.add_argument('--rounds', type=int, default=5, help="Timing rounds per micro-benchmark")
+    run_parser.add_argument('--startup-runs', type=int, default=5, help="Fresh interpreters per startup scenario")
+    run_parser.add_argument('--transport', choices=('inprocess', 'localhost'), default='inprocess')
+    run_parser.add_argument('--url', help="Server to load with the localhost transport (default: start one)")
+    run_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    run_parser.add_argument('--requests', type=int, default=2000,
+                            help="Requests per endpoint and concurrency level")
+    run_parser.add_argument('--log-mode', choices=('sync', 'async'), help="Logging mode (default: SURVEY_LOG_MODE)")
+    run_parser.add_argument('--log-level', help="Log level (default: SURVEY_LOG_LEVEL)")
+    run_parser.add_argument('--output', default='benchmark-results.json')
+    run_parser.add_argument('--baseline', help="Result file to compare against after the run")
+    run_parser.add_argument('--threshold', type=float, default=0.10,
+                            help="Fractional slowdown that counts as a regression (default: 0.10)")
+
+    compare_parser = commands.add_parser('compare', help="Compare a result file against a baseline")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10)
+
+    startup_parser = commands.add_parser('startup', help="Check cold-start times against a budget")
+    startup_parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per scenario")
+    startup_parser.add_argument('--budget', action='append', default=[], metavar='SCENARIO=MS',
+                                help="Override a scenario's budget in milliseconds, repeatable")
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return run(args)
+    if args.command == 'startup':
+        return check_startup(args)
+    rows = compare(load_results(args.baseline), load_results(args.current), args.threshold)
+    return 1 if print_comparison(rows, args.threshold) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Compare request latency with synchronous and asynchronous logging.
+
+Runs the same /api/process-survey requests through the Flask test client
+under each logging mode, writing logs to a temporary directory.
+
+Usage:
+    python -m benchmarks.bench_logging [--requests 2000] [--level DEBUG]
+"""
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as survey_app
+from log_config import configure_logging, shutdown_logging
+
+SURVEY = {'metric_a': 80, 'metric_b': 55, 'metric_c': 20, 'metric_d': 65}
+
+def measure(mode: str, requests: int, level: str) -> Dict[str, float]:
+    """Time ``requests`` survey submissions under one logging mode, in milliseconds"""
+    with tempfile.TemporaryDirectory() as log_dir:
+        configure_logging(mode=mode, level=level, log_dir=log_dir, console=False)
+        client = survey_app.app.test_client()
+        for _ in range(50):
+            client.post('/api/process-survey', json=SURVEY)
+
+        latencies: List[float] = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.post('/api/process-survey', json=SURVEY)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+
+        shutdown_logging()
+        logging.getLogger().handlers.clear()
+
+    latencies.sort()
+    return {
+        'mean': statistics.fmean(latencies),
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[int(len(latencies) * 0.99) - 1]
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--level', default='DEBUG')
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for mode in ('sync', 'async'):
+        result = measure(mode, args.requests, args.level)
+        print(f"{mode:<8}{result['mean']:>10.3f}{result['p50']:>10.3f}{result['p99']:>10.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Load generator for the API endpoints.
+
+Runs a fixed number of requests per endpoint at several concurrency
+levels, one client thread per concurrent request, and reports throughput
+and latency percentiles. Requests go either through the Flask test client
+in this process (``inprocess``, no network) or over HTTP/1.1 keep-alive
+connections to a server on localhost (``localhost``). Without a target URL
+the localhost transport starts the app on an ephemeral port in a
+background thread; point it at ``server.py`` to measure a worker pool.
+"""
+import http.client
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import app as survey_app
+from benchmarks.micro import SURVEY
+
+# (name, method, path, JSON body)
+TARGETS: Tuple[Tuple[str, str, str, Optional[Dict[str, Any]]], ...] = (
+    ('process_survey', 'POST', '/api/process-survey', SURVEY),
+    ('metrics', 'GET', '/api/metrics', None),
+    ('health', 'GET', '/health', None),
+)
+DEFAULT_CONCURRENCY = (1, 4, 16)
+
+def _percentile(latencies: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of sorted latencies"""
+    return latencies[max(int(len(latencies) * q + 0.5) - 1, 0)]
+
+def _inprocess_client(method: str, path: str, body: Optional[bytes]) -> Callable[[], int]:
+    client = survey_app.app.test_client()
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+
+    def send() -> int:
+        return client.open(path, method=method, data=body, headers=headers).status_code
+    return send
+
+def _http_client(host: str, port: int, method: str, path: str,
+                 body: Optional[bytes]) -> Callable[[], int]:
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+
+    def send() -> int:
+        nonlocal connection
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.getheader('Connection', '').lower() == 'close':
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+        return response.status
+    return send
+
+def run_level(make_client: Callable[[], Callable[[], int]], concurrency: int,
+              requests: int) -> Dict[str, float]:
+    """
+    Send ``requests`` requests from ``concurrency`` threads.
+
+    Returns:
+        Dict[str, float]: Requests per second, latency percentiles in
+        milliseconds and the number of failed requests
+    """
+    per_thread = max(requests // concurrency, 1)
+    latencies: List[List[float]] = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    clients = [make_client() for _ in range(concurrency)]
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(slot: int) -> None:
+        send, timings = clients[slot], latencies[slot]
+        barrier.wait()
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            try:
+                status = send()
+            except (OSError, http.client.HTTPException):
+                status = 0
+            timings.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors[slot] += 1
+
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    merged = sorted(latency for timings in latencies for latency in timings)
+    return {
+        'rps': len(merged) / elapsed,
+        'p50_ms': _percentile(merged, 0.50),
+        'p95_ms': _percentile(merged, 0.95),
+        'p99_ms': _percentile(merged, 0.99),
+        'requests': len(merged),
+        'errors': sum(errors)
+    }
+
+def _start_local_server() -> Tuple[str, int, Callable[[], None]]:
+    from werkzeug.serving import make_server
+    from server import KeepAliveRequestHandler
+
+    server = make_server('127.0.0.1', 0, survey_app.app, threaded=True,
+                         request_handler=KeepAliveRequestHandler)
+    threading.Thread(target=server.serve_forever, name='benchmark-server', daemon=True).start()
+    return '127.0.0.1', server.server_port, server.shutdown
+
+def run_load(transport: str = 'inprocess', concurrency: Sequence[int] = DEFAULT_CONCURRENCY,
+             requests: int = 2000, url: Optional[str] = None,
+             only: str = '') -> Dict[str, Dict[str, float]]:
+    """
+    Load every target endpoint whose name contains ``only``.
+
+    Args:
+        transport (str): ``inprocess`` or ``localhost``
+        concurrency (Sequence[int]): Concurrent client counts to run
+        requests (int): Requests per endpoint and concurrency level
+        url (Optional[str]): Server for the localhost transport, started
+            in this process if omitted
+        only (str): Substring filter on endpoint names
+
+    Returns:
+        Dict[str, Dict[str, float]]: Results keyed by
+        ``load.<transport>.<endpoint>.c<concurrency>``
+
+    Raises:
+        ValueError: If the transport is unknown
+    """
+    if transport not in ('inprocess', 'localhost'):
+        raise ValueError(f"Unknown transport: {transport}")
+
+    stop_server = None
+    if transport == 'localhost':
+        if url:
+            parts = urlsplit(url)
+            host, port = parts.hostname, parts.port or 80
+        else:
+            host, port, stop_server = _start_local_server()
+
+    results = {}
+    try:
+        for name, method, path, payload in TARGETS:
+            if only and only not in name:
+                continue
+            body = json.dumps(payload).encode('utf-8') if payload is not None else None
+            if transport == 'inprocess':
+                make_client = lambda: _inprocess_client(method, path, body)
+            else:
+                make_client = lambda: _http_client(host, port, method, path, body)
+            run_level(make_client, 1, min(requests, 100))  # warm up
+            for level in concurrency:
+                results[f'load.{transport}.{name}.c{level}'] = run_level(make_client, level, requests)
+    finally:
+        if stop_server is not None:
+            stop_server()
+    return results
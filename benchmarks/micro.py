@@ -0,0 +1,111 @@
+"""
+Micro-benchmarks for the evaluator and request hot paths.
+
+Each benchmark is timed with ``timeit`` in several rounds; the median time
+per call is reported in nanoseconds.
+"""
+import statistics
+import time
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+import app as survey_app
+from batch_codec import decode_batch, encode_batch
+from evaluator import (determine_chatbot_preset, determine_chatbot_presets_batch,
+                       determine_chatbot_presets_packed, encode_chatbot_presets, get_rule_table,
+                       validate_score)
+from rate_limit import RateLimit, TokenBucketLimiter
+
+SURVEY = {'metric_a': 80, 'metric_b': 55, 'metric_c': 20, 'metric_d': 65}
+BATCH_ROWS = 1000
+
+def time_call(fn: Callable[[], object], rounds: int = 5) -> Dict[str, float]:
+    """
+    Time ``fn`` in ``rounds`` rounds of enough calls to take about 0.2s each.
+
+    Returns:
+        Dict[str, float]: Median and best nanoseconds per call, and calls made
+    """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    per_call = [elapsed / number * 1e9 for elapsed in timer.repeat(rounds, number)]
+    return {
+        'ns_per_op': statistics.median(per_call),
+        'best_ns_per_op': min(per_call),
+        'calls': number * rounds
+    }
+
+def _decorated_view() -> Callable[[], object]:
+    """The request decorators from app.py around a view that does nothing"""
+    return survey_app.log_request(survey_app.handle_errors(lambda: None))
+
+def benchmarks() -> List[Tuple[str, Callable[[], object]]]:
+    """Return ``(name, callable)`` for every micro-benchmark"""
+    table = get_rule_table()
+    batch = {metric: [(score + row) % 101 for row in range(BATCH_ROWS)] for metric, score in SURVEY.items()}
+    packed = encode_batch(list(batch), zip(*batch.values()))
+    response = {
+        'success': True,
+        'metrics': SURVEY,
+        'presets': determine_chatbot_preset(SURVEY, table),
+        'timestamp': '2024-01-01T00:00:00'
+    }
+    app = survey_app.app
+    logger = survey_app.logger
+    view = _decorated_view()
+
+    def request_decorators():
+        with app.test_request_context('/health'):
+            view()
+
+    def request_context():
+        with app.test_request_context('/health'):
+            pass
+
+    metrics = survey_app.request_metrics
+
+    def instrumented_request():
+        metrics.start_request('/benchmark')
+        with metrics.stage('validate'):
+            pass
+        metrics.end_view(time.perf_counter_ns())
+        metrics.set_status(200)
+        metrics.finish_request()
+
+    limiter = TokenBucketLimiter()
+    unlimited = RateLimit(1e12, 1e12)
+
+    def jsonify_response():
+        with app.app_context():
+            survey_app.jsonify(response)
+
+    return [
+        ('validate_score', lambda: validate_score(73)),
+        ('determine_chatbot_preset', lambda: determine_chatbot_preset(SURVEY, table)),
+        ('encode_chatbot_presets', lambda: encode_chatbot_presets(SURVEY, table)),
+        (f'determine_chatbot_presets_batch_{BATCH_ROWS}', lambda: determine_chatbot_presets_batch(batch, table)),
+        (f'determine_chatbot_presets_packed_{BATCH_ROWS}',
+         lambda: determine_chatbot_presets_packed(decode_batch(packed), table)),
+        ('json.encode_json', lambda: survey_app.encode_json(response)),
+        ('json.jsonify', jsonify_response),
+        ('logging.info', lambda: logger.info("Request to %s completed in %.2fs", '/health', 0.001)),
+        ('logging.debug', lambda: logger.debug("Evaluating %s: score=%s", 'metric_a', 80)),
+        ('request_context', request_context),
+        ('request_decorators', request_decorators),
+        ('instrumentation.request', instrumented_request),
+        ('rate_limit.acquire', lambda: limiter.acquire('/api/process-survey 127.0.0.1', unlimited)),
+    ]
+
+def run_micro(rounds: int = 5, only: str = '') -> Dict[str, Dict[str, float]]:
+    """
+    Run every micro-benchmark whose name contains ``only``.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Timings keyed by ``micro.<name>``
+    """
+    results = {}
+    for name, fn in benchmarks():
+        if only and only not in name:
+            continue
+        results[f'micro.{name}'] = time_call(fn, rounds)
+    return results
@@ -0,0 +1,115 @@
+"""
+Benchmark result files and regression checks.
+
+A result file is JSON holding the run's environment and, under
+``results``, a flat mapping of benchmark name to measurements. Which way a
+measurement should move is decided by its name: ``rps`` should go up,
+times and error counts should go down. Anything else is informational.
+"""
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+RESULTS_FORMAT = 1
+
+# Measurements that are compared, and whether a larger value is better
+HIGHER_IS_BETTER = {
+    'rps': True,
+    'ns_per_op': False,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'errors': False,
+    'median_ms': False,
+    'files_created': False,
+}
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def write_results(path: Union[str, Path], results: Dict[str, Dict[str, float]],
+                  settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Save results along with the environment they were measured in.
+
+    Args:
+        path (Union[str, Path]): File to write
+        results (Dict[str, Dict[str, float]]): Measurements keyed by benchmark name
+        settings (Dict[str, Any]): Options the run used
+
+    Returns:
+        Dict[str, Any]: The document that was written
+    """
+    document = {
+        'format': RESULTS_FORMAT,
+        'created': datetime.now().isoformat(),
+        'commit': _git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'settings': settings,
+        'results': results
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    return document
+
+def load_results(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Read a result file.
+
+    Raises:
+        ValueError: If the file is not a benchmark result file
+    """
+    with open(path) as f:
+        document = json.load(f)
+    if not isinstance(document, dict) or document.get('format') != RESULTS_FORMAT:
+        raise ValueError(f"{path} is not a benchmark result file")
+    return document
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any],
+            threshold: float = 0.10) -> List[Dict[str, Any]]:
+    """
+    Compare every measurement present in both result documents.
+
+    A change counts as a regression when it moves the wrong way by more
+    than ``threshold`` (a fraction of the baseline), or when errors appear
+    where the baseline had none.
+
+    Returns:
+        List[Dict[str, Any]]: One row per compared measurement, with
+        ``benchmark``, ``measure``, ``baseline``, ``current``, ``change``
+        (fraction, None if the baseline is 0) and ``regression``
+    """
+    rows = []
+    for name, measures in sorted(current['results'].items()):
+        base_measures = baseline['results'].get(name)
+        if base_measures is None:
+            continue
+        for measure, higher_is_better in HIGHER_IS_BETTER.items():
+            if measure not in measures or measure not in base_measures:
+                continue
+            before, after = base_measures[measure], measures[measure]
+            if before:
+                change = (after - before) / before
+                worse = -change if higher_is_better else change
+                regression = worse > threshold
+            else:
+                change = None
+                regression = after > before if not higher_is_better else False
+            rows.append({
+                'benchmark': name,
+                'measure': measure,
+                'baseline': before,
+                'current': after,
+                'change': change,
+                'regression': regression
+            })
+    return rows
@@ -0,0 +1,108 @@
+"""
+Cold-start benchmarks.
+
+Each measurement runs in a fresh interpreter with an empty temporary
+working directory, so it includes every import and shows any file an
+import leaves behind. ``first_response`` covers importing the app and
+serving its first request through the test client.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_TIMER = 'import time\nstart = time.perf_counter()\n'
+_REPORT = '\nprint((time.perf_counter() - start) * 1000)\n'
+
+SCENARIOS = {
+    'import_evaluator': 'import evaluator',
+    'import_app': 'import app',
+    'first_response': (
+        'import app\n'
+        'response = app.app.test_client().get("/health")\n'
+        'assert response.status_code == 200, response.status_code'
+    ),
+}
+
+# Default budgets in milliseconds (median of the runs)
+STARTUP_BUDGET_MS = {
+    'import_evaluator': 100.0,
+    'import_app': 1000.0,
+    'first_response': 1500.0,
+}
+
+def _child_env() -> Dict[str, str]:
+    env = {key: value for key, value in os.environ.items() if not key.startswith('SURVEY_')}
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (str(ROOT), env.get('PYTHONPATH'))))
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    return env
+
+def measure(code: str) -> Dict[str, float]:
+    """
+    Run ``code`` in a fresh interpreter and time it.
+
+    Returns:
+        Dict[str, float]: Elapsed milliseconds and the number of files the
+        run left in its working directory
+
+    Raises:
+        RuntimeError: If the child process fails
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        completed = subprocess.run([sys.executable, '-c', _TIMER + code + _REPORT], cwd=workdir,
+                                   env=_child_env(), capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Startup benchmark failed:\n{completed.stderr}")
+        files_created = sum(1 for _ in Path(workdir).rglob('*'))
+    return {'ms': float(completed.stdout.strip().splitlines()[-1]), 'files_created': files_created}
+
+def run_startup(runs: int = 5, only: str = '') -> Dict[str, Dict[str, float]]:
+    """
+    Time every startup scenario whose name contains ``only``.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Median and best milliseconds and files
+        created, keyed by ``startup.<scenario>``
+    """
+    results = {}
+    for name, code in SCENARIOS.items():
+        if only and only not in name:
+            continue
+        samples = [measure(code) for _ in range(runs)]
+        timings = [sample['ms'] for sample in samples]
+        results[f'startup.{name}'] = {
+            'median_ms': statistics.median(timings),
+            'best_ms': min(timings),
+            'files_created': max(sample['files_created'] for sample in samples)
+        }
+    return results
+
+def check_budget(results: Dict[str, Dict[str, float]],
+                 budget: Optional[Dict[str, float]] = None) -> List[str]:
+    """
+    Check startup results against a budget.
+
+    Args:
+        results (Dict[str, Dict[str, float]]): Output of ``run_startup``
+        budget (Optional[Dict[str, float]]): Milliseconds allowed per
+            scenario, defaults to ``STARTUP_BUDGET_MS``
+
+    Returns:
+        List[str]: One message per scenario that was over budget or left
+        files behind
+    """
+    budget = STARTUP_BUDGET_MS if budget is None else budget
+    violations = []
+    for name, result in results.items():
+        scenario = name.split('.', 1)[1]
+        limit = budget.get(scenario)
+        if limit is not None and result['median_ms'] > limit:
+            violations.append(f"{scenario} took {result['median_ms']:.1f}ms, budget is {limit:g}ms")
+        if result['files_created']:
+            violations.append(f"{scenario} left {result['files_created']} files in the working directory")
+    return violations
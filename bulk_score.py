@@ -0,0 +1,222 @@
+"""
+Score survey results in bulk from NDJSON or CSV.
+
+Reads one survey per line (NDJSON objects, or CSV rows with a header of
+metric keys) from a file or stdin, scores them in chunks across a process
+pool and writes one result per line, in input order, to stdout or a file.
+Records that cannot be scored go to a separate reject stream. Memory use
+is bounded by the chunk size and the number of chunks in flight.
+
+Usage:
+    python bulk_score.py surveys.ndjson --output results.ndjson --rejects rejects.ndjson
+    cat surveys.csv | python bulk_score.py --format csv --workers 8
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from evaluator import determine_chatbot_presets_batch, get_rule_table, load_presets_file
+
+# A record is its 1-based line number in the input plus the raw NDJSON line or parsed CSV row
+Record = Tuple[int, Any]
+ChunkResult = Tuple[List[str], List[str]]
+
+def read_records(stream: TextIO, input_format: str) -> Iterator[Record]:
+    """
+    Lazily read records from an NDJSON or CSV stream.
+
+    Args:
+        stream (TextIO): Input stream
+        input_format (str): ``ndjson`` or ``csv``
+
+    Yields:
+        Record: Line number and raw record
+    """
+    if input_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if line.strip():
+                yield line_number, line.rstrip('\r\n')
+
+def chunked(records: Iterable[Record], chunk_size: int) -> Iterator[List[Record]]:
+    """Group records into lists of at most ``chunk_size``"""
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def _parse_record(raw: Any, input_format: str) -> Dict[str, Any]:
+    """Turn a raw record into a metrics dictionary, raising ValueError if it is malformed"""
+    if input_format == 'csv':
+        metrics = {}
+        for key, value in raw.items():
+            if key is None:
+                raise ValueError("Row has more fields than the header")
+            value = (value or '').strip()
+            if not value:
+                continue
+            try:
+                metrics[key] = int(value)
+            except ValueError:
+                raise ValueError(f"Invalid score for {key}: Score must be an integer")
+        return metrics
+
+    try:
+        metrics = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(metrics, dict):
+        raise ValueError("Record must be a JSON object of metric scores")
+    return metrics
+
+def score_chunk(chunk: List[Record], input_format: str) -> ChunkResult:
+    """
+    Parse, validate and score one chunk of records.
+
+    Args:
+        chunk (List[Record]): Records to score
+        input_format (str): ``ndjson`` or ``csv``
+
+    Returns:
+        ChunkResult: Encoded result lines and encoded reject lines
+    """
+    table = get_rule_table()
+    rejects: Dict[int, str] = {}
+    parsed: List[Tuple[int, Any, Dict[str, Any]]] = []
+
+    for line_number, raw in chunk:
+        try:
+            metrics = _parse_record(raw, input_format)
+            for metric in table.required:
+                if metric not in metrics:
+                    raise ValueError(f"Missing required metric: {metric}")
+            for metric in metrics:
+                if metric not in table:
+                    raise ValueError(f"Unknown metric: {metric}")
+        except ValueError as e:
+            rejects[line_number] = json.dumps({'line': line_number, 'error': str(e), 'record': raw})
+            continue
+        parsed.append((line_number, raw, metrics))
+
+    present = {metric for _, _, metrics in parsed for metric in metrics}
+    columns = {
+        metric: [metrics.get(metric) for _, _, metrics in parsed]
+        for metric in table.keys if metric in present
+    }
+    scored = determine_chatbot_presets_batch(columns, table) if parsed else []
+
+    results: List[str] = []
+    for (line_number, raw, metrics), result in zip(parsed, scored):
+        if result['success']:
+            results.append(json.dumps(
+                {'line': line_number, 'metrics': metrics, 'presets': result['presets']},
+                separators=(',', ':')
+            ))
+        else:
+            rejects[line_number] = json.dumps({'line': line_number, 'error': result['error'], 'record': raw})
+
+    return results, [rejects[line_number] for line_number in sorted(rejects)]
+
+def _init_worker(presets_file: Optional[str]) -> None:
+    """Keep worker logging off stdout and load the same presets as the parent"""
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr, force=True)
+    if presets_file:
+        load_presets_file(presets_file)
+
+def score_stream(records: Iterable[Record], input_format: str, workers: int,
+                 chunk_size: int, presets_file: Optional[str] = None) -> Iterator[ChunkResult]:
+    """
+    Score records chunk by chunk, yielding chunk results in input order.
+
+    With ``workers`` of 0 chunks are scored in this process; otherwise at
+    most two chunks per worker are in flight at any time.
+    """
+    chunks = chunked(records, chunk_size)
+    if workers == 0:
+        for chunk in chunks:
+            yield score_chunk(chunk, input_format)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(presets_file,)) as pool:
+        pending: deque = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, chunk, input_format))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _open_output(path: Optional[str]) -> TextIO:
+    return sys.stdout if path in (None, '-') else open(path, 'w', encoding='utf-8', newline='')
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the bulk scorer from the command line.
+
+    Returns:
+        int: Process exit status
+    """
+    parser = argparse.ArgumentParser(description="Score survey results in bulk from NDJSON or CSV.")
+    parser.add_argument('input', nargs='?', default='-', help="Input file, or - for stdin (default)")
+    parser.add_argument('--format', choices=('ndjson', 'csv'),
+                        help="Input format (default: csv for .csv files, otherwise ndjson)")
+    parser.add_argument('--output', '-o', help="Results file (default: stdout)")
+    parser.add_argument('--rejects', help="File for records that could not be scored (default: stderr)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes, 0 to score in this process (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=2000, help="Records per chunk (default: 2000)")
+    parser.add_argument('--presets', help="JSON or TOML presets file to score against")
+    parser.add_argument('--progress-interval', type=float, default=10.0,
+                        help="Seconds between throughput reports on stderr (default: 10)")
+    args = parser.parse_args(argv)
+
+    _init_worker(args.presets)
+    input_format = args.format or ('csv' if args.input.endswith('.csv') else 'ndjson')
+    source = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8', newline='')
+    output = _open_output(args.output)
+    rejects = sys.stderr if args.rejects is None else open(args.rejects, 'w', encoding='utf-8')
+
+    scored = rejected = 0
+    started = last_report = time.monotonic()
+    try:
+        for results, chunk_rejects in score_stream(read_records(source, input_format), input_format,
+                                                   args.workers, args.chunk_size, args.presets):
+            if results:
+                output.write('\n'.join(results) + '\n')
+            if chunk_rejects:
+                rejects.write('\n'.join(chunk_rejects) + '\n')
+            scored += len(results)
+            rejected += len(chunk_rejects)
+
+            now = time.monotonic()
+            if now - last_report >= args.progress_interval:
+                last_report = now
+                print(f"Scored {scored} records, rejected {rejected} "
+                      f"({(scored + rejected) / (now - started):.0f} records/s)", file=sys.stderr)
+    finally:
+        for stream in (source, output, rejects):
+            if stream not in (sys.stdin, sys.stdout, sys.stderr):
+                stream.close()
+
+    elapsed = time.monotonic() - started
+    total = scored + rejected
+    print(f"Done: {total} records in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} records/s), "
+          f"{scored} scored, {rejected} rejected", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
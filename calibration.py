@@ -0,0 +1,346 @@
+"""
+Threshold calibration over historical survey results.
+
+Stored results are read once into per-metric score histograms and pairwise
+joint histograms (101 and 101 x 101 bins, since scores are integers from 0
+to 100). Suffix sums over them give, in O(1) per lookup, how many surveys
+score at least ``t`` on a metric and how many score at least ``t1`` and
+``t2`` on a pair of metrics, so a grid of candidate thresholds is answered
+in time proportional to its size, however many results there are.
+
+Candidates are ranked by how far each preset's coverage (share of surveys
+that get it) is from a target, plus a weighted penalty for presets that
+are given together (mean pairwise co-occurrence).
+
+Usage:
+    python calibration.py results/ --step 5 --target 0.25
+    python calibration.py results/ . --grid metric_a=50:90:5 --grid metric_b=40,50,60 --json
+"""
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import sys
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+from batch_codec import MISSING_SCORE
+from preset_rules import PresetRuleTable
+from result_store import ResultStoreReader
+
+logger = logging.getLogger(__name__)
+
+SCORE_BINS = 101
+LEGACY_PATTERN = 'survey_results_*.json'
+
+# The store writes user_metrics first, so it can be decoded without the (larger) presets
+_USER_METRICS = re.compile(rb'\{"user_metrics":(\{[^{}]*\})')
+
+class ScoreHistograms:
+    """
+    Score histograms per metric and joint histograms per pair of metrics.
+
+    ``histograms[metric][s]`` counts surveys scoring ``s`` on the metric and
+    ``joint[(a, b)][s_a * 101 + s_b]`` those scoring ``s_a`` on ``a`` and
+    ``s_b`` on ``b``, for metric pairs in table order. Unanswered metrics
+    are not counted.
+    """
+    __slots__ = ('metrics', 'surveys', 'histograms', 'joint')
+
+    def __init__(self, metrics: Sequence[str]):
+        self.metrics: Tuple[str, ...] = tuple(metrics)
+        self.surveys = 0
+        self.histograms: Dict[str, array] = {metric: array('Q', bytes(8 * SCORE_BINS)) for metric in self.metrics}
+        self.joint: Dict[Tuple[str, str], array] = {
+            pair: array('Q', bytes(8 * SCORE_BINS * SCORE_BINS)) for pair in itertools.combinations(self.metrics, 2)
+        }
+
+    def add_columns(self, columns: Mapping[str, bytes], surveys: int) -> None:
+        """
+        Add surveys given as packed columns.
+
+        Histograms are filled with one ``bytes.count`` per score; joint
+        histograms count the 16-bit codes of two interleaved columns in a
+        single ``Counter`` pass, so no Python code runs per survey.
+
+        Args:
+            columns (Mapping[str, bytes]): One score byte per survey for each
+                metric; bytes above 100 mark surveys without that score
+            surveys (int): Number of surveys in the columns
+        """
+        self.surveys += surveys
+        for metric in self.metrics:
+            column = columns[metric]
+            histogram = self.histograms[metric]
+            for score in range(SCORE_BINS):
+                histogram[score] += column.count(score)
+
+        low, high = (0, 1) if sys.byteorder == 'little' else (1, 0)
+        pair_codes = bytearray(2 * surveys)
+        for (first, second), joint in self.joint.items():
+            pair_codes[low::2] = columns[first]
+            pair_codes[high::2] = columns[second]
+            for code, count in Counter(memoryview(pair_codes).cast('H')).items():
+                first_score, second_score = code & 0xFF, code >> 8
+                if first_score < SCORE_BINS and second_score < SCORE_BINS:
+                    joint[first_score * SCORE_BINS + second_score] += count
+
+    def at_least(self, metric: str) -> List[int]:
+        """Surveys scoring at least ``t`` on ``metric``, for ``t`` from 0 to 101"""
+        counts = [0] * (SCORE_BINS + 1)
+        histogram = self.histograms[metric]
+        for score in range(SCORE_BINS - 1, -1, -1):
+            counts[score] = counts[score + 1] + histogram[score]
+        return counts
+
+    def both_at_least(self, first: str, second: str) -> List[int]:
+        """
+        Surveys scoring at least ``t1`` on ``first`` and ``t2`` on
+        ``second``, at index ``t1 * 102 + t2`` for thresholds from 0 to 101
+        """
+        width = SCORE_BINS + 1
+        joint = self.joint[(first, second)]
+        counts = [0] * (width * width)
+        for first_score in range(SCORE_BINS - 1, -1, -1):
+            row = first_score * width
+            below = row + width
+            running = 0
+            for second_score in range(SCORE_BINS - 1, -1, -1):
+                running += joint[first_score * SCORE_BINS + second_score]
+                counts[row + second_score] = running + counts[below + second_score]
+        return counts
+
+def _packed_score(score: Any) -> int:
+    if isinstance(score, int) and not isinstance(score, bool) and 0 <= score <= 100:
+        return score
+    return MISSING_SCORE
+
+def iter_user_metrics(sources: Iterable[Union[str, Path]]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the ``user_metrics`` of every stored result.
+
+    A directory is read as a result store, along with any legacy
+    ``survey_results_*.json`` files in it; a file is read as one legacy
+    result. Unreadable legacy files are logged and skipped.
+    """
+    for source in sources:
+        source = Path(source)
+        if source.is_dir():
+            for _, payload in ResultStoreReader(source).iter_raw():
+                match = _USER_METRICS.match(payload)
+                yield json.loads(match.group(1)) if match else json.loads(payload)['user_metrics']
+            legacy_files = sorted(source.glob(LEGACY_PATTERN))
+        else:
+            legacy_files = [source]
+        for path in legacy_files:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    user_metrics = json.load(f)['user_metrics']
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Skipping {path}: {str(e)}")
+                continue
+            if isinstance(user_metrics, dict):
+                yield user_metrics
+
+def build_histograms(results: Iterable[Mapping[str, Any]], metrics: Sequence[str],
+                     chunk_size: int = 65536) -> ScoreHistograms:
+    """
+    Build histograms from ``user_metrics`` mappings, packing them into
+    columns ``chunk_size`` surveys at a time so memory stays bounded.
+
+    Scores that are not integers from 0 to 100 and metrics not in
+    ``metrics`` are ignored.
+    """
+    histograms = ScoreHistograms(metrics)
+    columns = {metric: bytearray() for metric in metrics}
+    appenders = [(metric, columns[metric].append) for metric in metrics]
+    pending = 0
+    for user_metrics in results:
+        for metric, append in appenders:
+            append(_packed_score(user_metrics.get(metric)))
+        pending += 1
+        if pending == chunk_size:
+            histograms.add_columns(columns, pending)
+            for column in columns.values():
+                column.clear()
+            pending = 0
+    if pending:
+        histograms.add_columns(columns, pending)
+    return histograms
+
+def parse_grid(specs: Iterable[str], table: PresetRuleTable) -> Dict[str, List[int]]:
+    """
+    Parse ``METRIC=START:STOP[:STEP]`` (inclusive) or ``METRIC=T1,T2,...`` entries.
+
+    Raises:
+        ValueError: If an entry is malformed, names an unknown metric or
+            has thresholds outside 0-100
+    """
+    grid = {}
+    for spec in specs:
+        metric, separator, values = spec.partition('=')
+        if not separator or metric not in table:
+            raise ValueError(f"Invalid grid {spec!r}, expected METRIC=START:STOP[:STEP] or METRIC=T1,T2,... "
+                             f"for a metric in the presets")
+        try:
+            if ':' in values:
+                bounds = [int(value) for value in values.split(':')]
+                if len(bounds) not in (2, 3) or (len(bounds) == 3 and bounds[2] <= 0):
+                    raise ValueError
+                thresholds = list(range(bounds[0], bounds[1] + 1, bounds[2] if len(bounds) == 3 else 1))
+            else:
+                thresholds = sorted({int(value) for value in values.split(',')})
+        except ValueError:
+            raise ValueError(f"Invalid thresholds in grid {spec!r}")
+        if not thresholds or not all(0 <= threshold <= 100 for threshold in thresholds):
+            raise ValueError(f"Thresholds in grid {spec!r} must be between 0 and 100")
+        grid[metric] = thresholds
+    return grid
+
+def sweep(histograms: ScoreHistograms, grid: Mapping[str, Sequence[int]], targets: Mapping[str, float],
+          overlap_weight: float = 0.5, top: int = 20) -> List[Dict[str, Any]]:
+    """
+    Rank every combination of candidate thresholds.
+
+    Each candidate costs one lookup per metric and per metric pair. Its
+    score is the sum over metrics of ``|coverage - target|`` plus
+    ``overlap_weight`` times the mean pairwise co-occurrence; lower is
+    better.
+
+    Args:
+        histograms (ScoreHistograms): Histograms of the stored results
+        grid (Mapping[str, Sequence[int]]): Candidate thresholds for every
+            metric in ``histograms``
+        targets (Mapping[str, float]): Desired coverage of each metric's preset
+        overlap_weight (float): Weight of the co-occurrence penalty
+        top (int): Number of candidates to return
+
+    Returns:
+        List[Dict[str, Any]]: The best candidates, best first, with their
+        ``thresholds``, preset ``coverage``, pairwise ``co_occurrence``
+        (keyed ``"a+b"``), ``mean_presets`` per survey and ``score``
+    """
+    metrics = histograms.metrics
+    total = histograms.surveys or 1
+    coverage = {metric: [count / total for count in histograms.at_least(metric)] for metric in metrics}
+    pairs = list(histograms.joint)
+    together = {pair: [count / total for count in histograms.both_at_least(*pair)] for pair in pairs}
+    width = SCORE_BINS + 1
+    pair_weight = overlap_weight / len(pairs) if pairs else 0.0
+
+    # Each metric's coverage error and each pair's penalty only depend on its own thresholds
+    errors = [[abs(coverage[metric][threshold] - targets[metric]) for threshold in grid[metric]] for metric in metrics]
+    positions = {metric: index for index, metric in enumerate(metrics)}
+    pair_terms = [(positions[first], positions[second], together[(first, second)]) for first, second in pairs]
+    choices = [list(enumerate(grid[metric])) for metric in metrics]
+
+    def scored() -> Iterator[Tuple[float, Tuple[int, ...]]]:
+        for candidate in itertools.product(*choices):
+            score = 0.0
+            for position, (index, _) in enumerate(candidate):
+                score += errors[position][index]
+            for first, second, counts in pair_terms:
+                score += pair_weight * counts[candidate[first][1] * width + candidate[second][1]]
+            yield score, tuple(threshold for _, threshold in candidate)
+
+    ranked = []
+    for score, thresholds in heapq.nsmallest(top, scored(), key=lambda item: item[0]):
+        chosen = dict(zip(metrics, thresholds))
+        covered = {metric: coverage[metric][chosen[metric]] for metric in metrics}
+        ranked.append({
+            'thresholds': chosen,
+            'coverage': covered,
+            'co_occurrence': {f'{first}+{second}': together[(first, second)][chosen[first] * width + chosen[second]]
+                              for first, second in pairs},
+            'mean_presets': sum(covered.values()),
+            'score': score
+        })
+    return ranked
+
+def print_table(ranked: List[Dict[str, Any]], metrics: Sequence[str], surveys: int,
+                current: Optional[Dict[str, Any]] = None) -> None:
+    """Print ranked candidates, and the current thresholds for reference"""
+    print(f"{surveys:,} surveys; coverage and worst pairwise co-occurrence in %")
+    header = f"{'rank':>4}" + ''.join(f"{metric:>18}" for metric in metrics)
+    print(header + f"{'presets/survey':>16}{'max overlap':>13}{'score':>9}")
+    rows = [(str(rank), candidate) for rank, candidate in enumerate(ranked, 1)]
+    if current is not None:
+        rows.append(('now', current))
+    for label, candidate in rows:
+        cells = ''
+        for metric, threshold in candidate['thresholds'].items():
+            cell = f"{threshold} ({candidate['coverage'][metric] * 100:.1f})"
+            cells += f"{cell:>18}"
+        overlap = max(candidate['co_occurrence'].values(), default=0.0) * 100
+        print(f"{label:>4}{cells}{candidate['mean_presets']:>16.2f}{overlap:>13.1f}{candidate['score']:>9.4f}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run a threshold sweep from the command line.
+
+    Returns:
+        int: Process exit status
+    """
+    from evaluator import get_rule_table, load_presets_file
+
+    parser = argparse.ArgumentParser(description="Rank candidate preset thresholds against stored survey results.")
+    parser.add_argument('sources', nargs='*',
+                        help="Result store directories (also searched for legacy survey_results_*.json files) "
+                             "or legacy result files (default: SURVEY_RESULTS_DIR or results)")
+    parser.add_argument('--grid', action='append', default=[],
+                        help="Candidate thresholds for one metric, METRIC=START:STOP[:STEP] or METRIC=T1,T2,...; "
+                             "repeatable. Metrics without a grid keep their current threshold, unless no grid is "
+                             "given, in which case every metric is swept with --step")
+    parser.add_argument('--step', type=int, default=5, help="Threshold step of the default sweep (default: 5)")
+    parser.add_argument('--target', action='append', default=[],
+                        help="Desired preset coverage, a fraction for every metric or METRIC=FRACTION for one; "
+                             "repeatable (default: 0.25)")
+    parser.add_argument('--overlap-weight', type=float, default=0.5,
+                        help="Weight of the mean pairwise co-occurrence penalty (default: 0.5)")
+    parser.add_argument('--top', type=int, default=20, help="Candidates to show (default: 20)")
+    parser.add_argument('--presets', help="JSON or TOML presets file whose metrics and thresholds to start from")
+    parser.add_argument('--json', action='store_true', help="Print the ranking as JSON")
+    args = parser.parse_args(argv)
+
+    table = load_presets_file(args.presets) if args.presets else get_rule_table()
+    try:
+        grid = parse_grid(args.grid, table)
+        if args.step <= 0:
+            raise ValueError("--step must be positive")
+        targets = {}
+        default_target = 0.25
+        for spec in args.target:
+            metric, separator, fraction = spec.rpartition('=')
+            if separator and metric not in table:
+                raise ValueError(f"Unknown metric in --target {spec!r}")
+            if separator:
+                targets[metric] = float(fraction)
+            else:
+                default_target = float(fraction)
+    except ValueError as e:
+        parser.error(str(e))
+    for rule in table:
+        grid.setdefault(rule.key, [rule.threshold] if args.grid else list(range(0, 101, args.step)))
+        targets.setdefault(rule.key, default_target)
+
+    sources = args.sources or [os.environ.get('SURVEY_RESULTS_DIR', 'results')]
+    histograms = build_histograms(iter_user_metrics(sources), table.keys)
+    if not histograms.surveys:
+        print(f"No results found in {', '.join(map(str, sources))}", file=sys.stderr)
+        return 1
+
+    ranked = sweep(histograms, grid, targets, args.overlap_weight, args.top)
+    current = sweep(histograms, {rule.key: [rule.threshold] for rule in table}, targets, args.overlap_weight, 1)[0]
+    if args.json:
+        print(json.dumps({'surveys': histograms.surveys, 'current': current, 'ranked': ranked}, indent=4))
+    else:
+        print_table(ranked, table.keys, histograms.surveys, current)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
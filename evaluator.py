@@ -1,14 +1,26 @@
-import json
+import atexit
 import logging
+import re
 import sys
 import os
+from array import array
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Any
 from pathlib import Path
 
+from batch_codec import (MISSING_SCORE, ROW_INVALID_SCORE, ROW_MISSING_SCORE, PackedBatch,
+                         mask_width)
+from preset_rules import PresetRuleTable, RuleFileWatcher, compile_rules, load_rules_file
+from result_store import ResultStore
+
 # Configure logging with more detailed settings
 def setup_logging() -> logging.Logger:
-    """Configure and return logger with detailed settings"""
+    """
+    Configure and return logger with detailed settings.
+
+    Only the interactive entry point calls this; importing the module
+    leaves logging to the program that imports it.
+    """
     # Create logs directory if it doesn't exist
     log_dir = Path("logs")
     log_dir.mkdir(exist_ok=True)
@@ -28,7 +40,7 @@ def setup_logging() -> logging.Logger:
     )
     return logging.getLogger(__name__)
 
-logger = setup_logging()
+logger = logging.getLogger(__name__)
 
 class SurveyMetric:
     """Class to represent a survey metric with validation"""
@@ -70,7 +82,75 @@ survey_presets = {
     )
 }
 
-class ScoreValidationError(Exception):
+# Metrics every submission must provide; the remaining presets are optional
+REQUIRED_METRICS = ('metric_a', 'metric_b', 'metric_c')
+
+# Active compiled rule table. Readers take the reference once per call and
+# reloads replace it wholesale, so the read path needs no lock.
+_rule_table: Optional[PresetRuleTable] = None
+_rule_watcher: Optional[RuleFileWatcher] = None
+# Called with every table before it becomes active; each raises ValueError to refuse it
+_rule_table_checks: List[Callable[[PresetRuleTable], None]] = []
+
+def get_rule_table() -> PresetRuleTable:
+    """Return the active preset rule table, compiling the built-in presets on first use"""
+    table = _rule_table
+    if table is None:
+        table = install_rule_table(compile_rules(survey_presets, REQUIRED_METRICS))
+    return table
+
+def install_rule_table(table: PresetRuleTable) -> PresetRuleTable:
+    """
+    Atomically replace the active preset rule table.
+
+    Raises:
+        ValueError: If a check added with ``add_rule_table_check`` refuses
+            the table, which then does not become active
+    """
+    global _rule_table
+    for check in _rule_table_checks:
+        check(table)
+    _rule_table = table
+    return table
+
+def add_rule_table_check(check: Callable[[PresetRuleTable], None]) -> None:
+    """
+    Refuse rule tables that ``check`` rejects by raising ValueError, from
+    now on and starting with the active table.
+
+    Raises:
+        ValueError: If ``check`` rejects the active table
+    """
+    check(get_rule_table())
+    _rule_table_checks.append(check)
+
+def load_presets_file(path: str, watch_interval: Optional[float] = None) -> PresetRuleTable:
+    """
+    Load preset rules from a JSON or TOML file and make them active.
+
+    Args:
+        path (str): Path to the presets file
+        watch_interval (Optional[float]): If given, poll the file every this
+            many seconds and swap in a recompiled table when it changes
+
+    Returns:
+        PresetRuleTable: The newly active table
+
+    Raises:
+        ValueError: If the file cannot be loaded
+    """
+    global _rule_watcher
+    table = install_rule_table(load_rules_file(path))
+    logger.info("Loaded %s presets from %s (version %s)", len(table), path, table.version)
+
+    if _rule_watcher is not None:
+        _rule_watcher.stop()
+        _rule_watcher = None
+    if watch_interval:
+        _rule_watcher = RuleFileWatcher(path, install_rule_table, watch_interval).start()
+    return table
+
+class ScoreValidationError(ValueError):
     """Custom exception for score validation errors"""
     pass
 
@@ -87,7 +167,7 @@ def validate_score(score: int) -> bool:
     Raises:
         ScoreValidationError: If score is invalid
     """
-    if not isinstance(score, int):
+    if isinstance(score, bool) or not isinstance(score, int):
         raise ScoreValidationError("Score must be an integer")
     if not 0 <= score <= 100:
         raise ScoreValidationError("Score must be between 0 and 100")
@@ -107,13 +187,14 @@ def get_user_metrics() -> Dict[str, int]:
     metrics: Dict[str, int] = {}
     
     try:
-        for metric_key, metric_obj in survey_presets.items():
+        for metric_obj in get_rule_table().rules:
+            metric_key = metric_obj.key
             attempts = 0
             max_attempts = 3
             
             while attempts < max_attempts:
                 try:
-                    logger.debug(f"Processing input for {metric_obj.name}...")
+                    logger.debug("Processing input for %s...", metric_obj.name)
                     score_input = input(f"Enter your score for {metric_obj.name} (0-100): ").strip()
                     
                     # Allow user to exit
@@ -124,21 +205,21 @@ def get_user_metrics() -> Dict[str, int]:
                     validate_score(score)
                     
                     metrics[metric_key] = score
-                    logger.info(f"Successfully recorded score for {metric_obj.name}: {score}")
+                    logger.info("Successfully recorded score for %s: %s", metric_obj.name, score)
                     break
                     
                 except (ValueError, ScoreValidationError) as e:
                     attempts += 1
                     remaining = max_attempts - attempts
-                    logger.warning(f"Invalid input for {metric_obj.name}: {str(e)}")
+                    logger.warning("Invalid input for %s: %s", metric_obj.name, e)
                     if remaining > 0:
                         print(f"Invalid input: {e}. {remaining} attempts remaining.")
                     else:
-                        logger.error(f"Max attempts reached for {metric_obj.name}, defaulting to 0")
+                        logger.error("Max attempts reached for %s, defaulting to 0", metric_obj.name)
                         metrics[metric_key] = 0
                         print(f"Max attempts reached. Setting {metric_obj.name} score to 0.")
         
-        logger.info(f"Completed metric collection: {metrics}")
+        logger.info("Completed metric collection: %s", metrics)
         return metrics
         
     except KeyboardInterrupt:
@@ -146,12 +227,15 @@ def get_user_metrics() -> Dict[str, int]:
         print("\nSurvey cancelled by user.")
         sys.exit(0)
 
-def determine_chatbot_preset(user_metrics: Dict[str, int]) -> List[Dict[str, Any]]:
+def determine_chatbot_preset(user_metrics: Dict[str, int],
+                             table: Optional[PresetRuleTable] = None) -> List[Dict[str, Any]]:
     """
     Determine appropriate chatbot presets based on user metrics.
     
     Args:
         user_metrics (Dict[str, int]): Dictionary of user metric scores
+        table (Optional[PresetRuleTable]): Rule table to evaluate against,
+            defaults to the active table
         
     Returns:
         List[Dict[str, Any]]: List of selected preset configurations
@@ -160,52 +244,326 @@ def determine_chatbot_preset(user_metrics: Dict[str, int]) -> List[Dict[str, Any
         KeyError: If metric key is not found in presets
     """
     logger.info("Starting chatbot preset determination...")
+    if table is None:
+        table = get_rule_table()
     chatbot_presets = []
     
     try:
         for metric, value in user_metrics.items():
-            if metric not in survey_presets:
+            metric_obj = table.get(metric)
+            if metric_obj is None:
                 raise KeyError(f"Unknown metric: {metric}")
                 
-            metric_obj = survey_presets[metric]
-            logger.debug(f"Evaluating {metric_obj.name}: score={value}, threshold={metric_obj.threshold}")
+            logger.debug("Evaluating %s: score=%s, threshold=%s", metric_obj.name, value, metric_obj.threshold)
             
             if value >= metric_obj.threshold:
-                preset_config = {
-                    'name': metric_obj.name,
-                    'preset': metric_obj.preset,
-                    'description': metric_obj.description,
-                    'score': value,
-                    'threshold': metric_obj.threshold,
-                    'exceeded_by': value - metric_obj.threshold
-                }
+                preset_config = metric_obj.payload(value)
                 chatbot_presets.append(preset_config)
-                logger.info(f"Added preset configuration: {preset_config}")
+                logger.info("Added preset configuration: %s", preset_config)
     
     except KeyError as e:
-        logger.error(f"Error accessing preset configuration: {str(e)}")
+        logger.error("Error accessing preset configuration: %s", e)
         raise
         
-    logger.info(f"Completed preset determination. Selected {len(chatbot_presets)} presets")
+    logger.info("Completed preset determination. Selected %s presets", len(chatbot_presets))
     return chatbot_presets
 
-def save_results(user_metrics: Dict[str, int], chatbot_presets: List[Dict[str, Any]]) -> None:
-    """Save survey results to JSON file with timestamp"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f'survey_results_{timestamp}.json'
+def encode_chatbot_presets(user_metrics: Dict[str, int],
+                           table: Optional[PresetRuleTable] = None) -> bytes:
+    """
+    Encode the presets for validated user metrics straight to JSON.
+
+    Produces the same presets as ``determine_chatbot_preset``, already
+    serialized, by joining fragments that were encoded once per metric and
+    score instead of building and encoding a dict for every request.
     
-    results = {
-        'timestamp': datetime.now().isoformat(),
-        'user_metrics': user_metrics,
-        'selected_presets': chatbot_presets
-    }
+    Args:
+        user_metrics (Dict[str, int]): Dictionary of validated user metric scores
+        table (Optional[PresetRuleTable]): Rule table to evaluate against,
+            defaults to the active table
+        
+    Returns:
+        bytes: JSON array of selected preset configurations
+        
+    Raises:
+        KeyError: If metric key is not found in presets
+    """
+    if table is None:
+        table = get_rule_table()
+    return table.encode_presets(user_metrics)
+
+# Byte values that are valid scores, used to range-check packed columns in one pass
+_VALID_SCORE_BYTES = bytes(range(101))
+_HIT = re.compile(b'\x01')
+
+def _pack_score_column(metric: str, values: Sequence[Any], required: bool,
+                       row_errors: Dict[int, str]) -> Tuple[bytes, Optional[bytes]]:
+    """
+    Pack a column of scores into one byte per row.
+
+    The whole column is converted and range-checked in C; only a column that
+    fails the fast path is walked value by value to find the offending rows.
+
+    Args:
+        metric (str): Metric key the column belongs to
+        values (Sequence[Any]): Raw scores, one per row
+        required (bool): Whether a missing (None) score is an error
+        row_errors (Dict[int, str]): Per-row error messages, updated in place
+
+    Returns:
+        Tuple[bytes, Optional[bytes]]: Packed scores and, if any row skipped
+        this optional metric, a mask with 1 for rows that answered it
+    """
+    try:
+        # array() takes True and False as 1 and 0, so columns holding them take the slow path
+        if bool not in set(map(type, values)):
+            packed = array('B', values).tobytes()
+            if not packed.translate(None, _VALID_SCORE_BYTES):
+                return packed, None
+    except (TypeError, OverflowError):
+        pass
+
+    scores = bytearray(len(values))
+    answered = bytearray(b'\x01') * len(values)
+    for row, value in enumerate(values):
+        if value is None and not required:
+            answered[row] = 0
+            continue
+        try:
+            validate_score(value)
+            scores[row] = value
+        except ScoreValidationError as e:
+            answered[row] = 0
+            row_errors.setdefault(row, f"Invalid score for {metric}: {e}")
+    return bytes(scores), bytes(answered) if 0 in answered else None
+
+def determine_chatbot_presets_batch(metric_columns: Dict[str, Sequence[Any]],
+                                    table: Optional[PresetRuleTable] = None) -> List[Dict[str, Any]]:
+    """
+    Determine chatbot presets for many surveys given as columnar arrays.
+
+    Each metric maps to a list holding one score per survey. Columns are
+    validated and compared against their thresholds as a whole, so the cost
+    per survey is a few C-level byte operations plus building its result.
+    A bad score only fails its own row; optional metrics may use None for
+    surveys that did not answer them.
+
+    Args:
+        metric_columns (Dict[str, Sequence[Any]]): Metric key to column of scores
+        table (Optional[PresetRuleTable]): Rule table to evaluate against,
+            defaults to the active table
+
+    Returns:
+        List[Dict[str, Any]]: One result per row, either
+        ``{'index', 'success': True, 'presets'}`` or
+        ``{'index', 'success': False, 'error', 'error_type'}``
+
+    Raises:
+        KeyError: If metric key is not found in presets
+        ValueError: If columns are not lists of equal length
+    """
+    if table is None:
+        table = get_rule_table()
+    for metric, values in metric_columns.items():
+        if metric not in table:
+            raise KeyError(f"Unknown metric: {metric}")
+        if not isinstance(values, (list, tuple)):
+            raise ValueError(f"Column for {metric} must be a list of scores")
+
+    row_counts = {len(values) for values in metric_columns.values()}
+    if len(row_counts) > 1:
+        raise ValueError("All metric columns must have the same length")
+    row_count = row_counts.pop() if row_counts else 0
+    logger.info("Starting batch preset determination for %s surveys...", row_count)
+
+    row_errors: Dict[int, str] = {}
+    row_presets: List[List[Dict[str, Any]]] = [[] for _ in range(row_count)]
+
+    for metric, values in metric_columns.items():
+        metric_obj = table.get(metric)
+        packed, answered = _pack_score_column(metric, values, metric_obj.required, row_errors)
+        hits = packed.translate(metric_obj.pass_table)
+        if answered is not None:
+            hits = (int.from_bytes(hits, 'big') & int.from_bytes(answered, 'big')).to_bytes(row_count, 'big')
+        for match in _HIT.finditer(hits):
+            row = match.start()
+            row_presets[row].append(metric_obj.payload(packed[row]))
+
+    results: List[Dict[str, Any]] = []
+    for row, presets in enumerate(row_presets):
+        if row in row_errors:
+            results.append({
+                'index': row,
+                'success': False,
+                'error': row_errors[row],
+                'error_type': 'ValidationError'
+            })
+        else:
+            results.append({'index': row, 'success': True, 'presets': presets})
+
+    logger.info("Completed batch preset determination. %s of %s surveys rejected", len(row_errors), row_count)
+    return results
+
+# Any byte of a packed batch that is neither a valid score nor the missing marker
+_OUT_OF_RANGE = re.compile(b'[\x65-\xfe]')
+_MISSING = re.compile(bytes((MISSING_SCORE,)))
+# bytes.translate tables turning a 0/1 hit column into one bit of a mask byte
+_BIT_TABLES = tuple(bytes((0, 1 << bit)) + bytes(254) for bit in range(8))
+
+class PackedBatchResult:
+    """
+    Outcome of evaluating a binary batch, kept in packed form.
+
+    ``statuses`` holds one status byte per row and ``masks`` the row-major
+    preset bitmasks, ready to send as a binary result. ``columns`` and
+    ``hits`` hold each metric's scores and 0/1 threshold hits, with rejected
+    rows set to the missing marker and 0, for statistics.
+    """
+    __slots__ = ('metrics', 'row_count', 'statuses', 'masks', 'columns', 'hits', 'row_errors')
+
+    def __init__(self, metrics: Tuple[str, ...], row_count: int, statuses: bytes, masks: bytes,
+                 columns: Dict[str, bytes], hits: Dict[str, bytes], row_errors: Dict[int, str]):
+        self.metrics = metrics
+        self.row_count = row_count
+        self.statuses = statuses
+        self.masks = masks
+        self.columns = columns
+        self.hits = hits
+        self.row_errors = row_errors
+
+    def row_metrics(self, row: int) -> Dict[str, int]:
+        """Return the scores a row answered"""
+        return {
+            metric: column[row] for metric, column in self.columns.items() if column[row] != MISSING_SCORE
+        }
+
+    def results(self, table: PresetRuleTable) -> List[Dict[str, Any]]:
+        """Expand into per-row results shaped like ``determine_chatbot_presets_batch`` output"""
+        row_presets: List[List[Dict[str, Any]]] = [[] for _ in range(self.row_count)]
+        for metric in self.metrics:
+            rule, column = table.get(metric), self.columns[metric]
+            for match in _HIT.finditer(self.hits[metric]):
+                row = match.start()
+                row_presets[row].append(rule.payload(column[row]))
+
+        results = []
+        for row, presets in enumerate(row_presets):
+            if row in self.row_errors:
+                results.append({
+                    'index': row,
+                    'success': False,
+                    'error': self.row_errors[row],
+                    'error_type': 'ValidationError'
+                })
+            else:
+                results.append({'index': row, 'success': True, 'presets': presets})
+        return results
+
+def determine_chatbot_presets_packed(batch: PackedBatch,
+                                     table: Optional[PresetRuleTable] = None) -> PackedBatchResult:
+    """
+    Determine chatbot presets for a decoded binary batch.
+
+    One regular expression pass over the whole score block finds every
+    out-of-range byte, and each metric's column is compared against its
+    threshold with a single ``bytes.translate``. Python code only runs per
+    rejected row, never per score.
+
+    Args:
+        batch (PackedBatch): Decoded batch
+        table (Optional[PresetRuleTable]): Rule table to evaluate against,
+            defaults to the active table
+
+    Returns:
+        PackedBatchResult: Row statuses, preset masks and packed columns
+
+    Raises:
+        KeyError: If metric key is not found in presets
+    """
+    if table is None:
+        table = get_rule_table()
+    for metric in batch.metrics:
+        if metric not in table:
+            raise KeyError(f"Unknown metric: {metric}")
+
+    metric_count, row_count = len(batch.metrics), batch.row_count
+    logger.info("Starting packed batch preset determination for %s surveys...", row_count)
+    statuses = bytearray(row_count)
+    row_errors: Dict[int, str] = {}
+
+    for match in _OUT_OF_RANGE.finditer(batch.scores):
+        row, position = divmod(match.start(), metric_count)
+        if row not in row_errors:
+            statuses[row] = ROW_INVALID_SCORE
+            row_errors[row] = (f"Invalid score for {batch.metrics[position]}: "
+                               "Score must be between 0 and 100")
+
+    columns: Dict[str, bytes] = {}
+    for position, metric in enumerate(batch.metrics):
+        column = batch.column(position).tobytes()
+        if table.get(metric).required:
+            for match in _MISSING.finditer(column):
+                row = match.start()
+                if row not in row_errors:
+                    statuses[row] = ROW_MISSING_SCORE
+                    row_errors[row] = f"Invalid score for {metric}: Score is required"
+        columns[metric] = column
+
+    if row_errors:
+        for metric, column in columns.items():
+            column = bytearray(column)
+            for row in row_errors:
+                column[row] = MISSING_SCORE
+            columns[metric] = bytes(column)
+
+    hits = {metric: column.translate(table.get(metric).pass_table) for metric, column in columns.items()}
+
+    width = mask_width(metric_count)
+    masks = bytearray(row_count * width)
+    for plane in range(width):
+        combined = 0
+        for position in range(plane * 8, min(plane * 8 + 8, metric_count)):
+            bits = hits[batch.metrics[position]].translate(_BIT_TABLES[position % 8])
+            combined |= int.from_bytes(bits, 'little')
+        masks[plane::width] = combined.to_bytes(row_count, 'little')
+
+    logger.info("Completed packed batch preset determination. %s of %s surveys rejected",
+                len(row_errors), row_count)
+    return PackedBatchResult(batch.metrics, row_count, bytes(statuses), bytes(masks),
+                             columns, hits, row_errors)
+
+_result_store: Optional[ResultStore] = None
+
+def get_result_store() -> ResultStore:
+    """Return the process-wide result store under SURVEY_RESULTS_DIR (default ``results``)"""
+    global _result_store
+    if _result_store is None:
+        _result_store = ResultStore(os.environ.get('SURVEY_RESULTS_DIR', 'results'))
+        atexit.register(_result_store.close)
+    return _result_store
+
+def save_results(user_metrics: Dict[str, int], chatbot_presets: List[Dict[str, Any]],
+                 store: Optional[ResultStore] = None) -> None:
+    """
+    Append survey results to the result store.
+
+    Args:
+        user_metrics (Dict[str, int]): Submitted metric scores
+        chatbot_presets (List[Dict[str, Any]]): Presets selected for them
+        store (Optional[ResultStore]): Store to append to, defaults to
+            the process-wide store
+
+    Raises:
+        IOError: If the result cannot be written
+    """
+    if store is None:
+        store = get_result_store()
     
     try:
-        with open(filename, 'w') as f:
-            json.dump(results, f, indent=4)
-        logger.info(f"Survey results saved to {filename}")
+        store.append(user_metrics, chatbot_presets)
+        logger.info("Survey results saved to %s", store.directory)
     except IOError as e:
-        logger.error(f"Failed to save results: {str(e)}")
+        logger.error("Failed to save results: %s", e)
         raise
 
 def main() -> None:
@@ -237,11 +595,15 @@ def main() -> None:
         save_results(user_metrics, chatbot_presets)
             
     except Exception as e:
-        logger.error(f"An unexpected error occurred: {str(e)}", exc_info=True)
+        logger.error("An unexpected error occurred: %s", e, exc_info=True)
         print("An error occurred while processing your survey. Please check the logs for details.")
         
     logger.info("Survey calculator application completed.")
 
-# Entry point for the script
+# Entry point for the script; any arguments switch to non-interactive bulk scoring
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        from bulk_score import main as bulk_main
+        sys.exit(bulk_main(sys.argv[1:]))
+    logger = setup_logging()
     main()
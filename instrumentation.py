@@ -0,0 +1,297 @@
+"""
+Low-overhead request instrumentation.
+
+Latencies are measured with ``time.perf_counter_ns`` and counted into
+fixed-bucket histograms per route and per stage, next to request counts by
+status, error counts by ``error_type`` and in-flight gauges. Every thread
+records into its own shard, so the request path never takes a lock; a
+scrape adds the shards together. The threaded server starts a thread per
+connection, so shards of exited threads are folded into a retired total.
+Everything is rendered in the Prometheus text exposition format.
+"""
+import cProfile
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from log_config import LogSampler
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+_BOUNDS_NS = tuple(int(bound * 1e9) for bound in LATENCY_BUCKETS)
+# Histogram layout: one count per bucket, one for +Inf, then the sum in nanoseconds
+_HISTOGRAM_SIZE = len(_BOUNDS_NS) + 2
+_SUM = -1
+
+# Stage name under which whole-request latency is kept
+TOTAL = ''
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+class _Shard:
+    """Counters written only by the thread that owns them"""
+    __slots__ = ('thread', 'route', 'start', 'view_end', 'status', 'started', 'histograms', 'requests', 'errors')
+
+    def __init__(self, thread: Optional[threading.Thread] = None):
+        self.thread = thread
+        # State of the request the thread is handling
+        self.route = ''
+        self.start = 0
+        self.view_end = 0
+        self.status = 0
+        self.started: Dict[str, int] = {}
+        self.histograms: Dict[Tuple[str, str], List[int]] = {}
+        self.requests: Dict[Tuple[str, int], int] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+
+    def add(self, other: '_Shard') -> None:
+        """Add another shard's counters, copying its dicts first since its owner may still be writing"""
+        for route, count in dict(other.started).items():
+            self.started[route] = self.started.get(route, 0) + count
+        for key, histogram in dict(other.histograms).items():
+            totals = self.histograms.get(key)
+            if totals is None:
+                totals = self.histograms[key] = [0] * _HISTOGRAM_SIZE
+            for bucket, count in enumerate(list(histogram)):
+                totals[bucket] += count
+        for counters, other_counters in ((self.requests, other.requests), (self.errors, other.errors)):
+            for key, count in dict(other_counters).items():
+                counters[key] = counters.get(key, 0) + count
+
+class _Stage:
+    """Context manager timing one stage of the current request"""
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics: 'RequestMetrics', name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self) -> '_Stage':
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.metrics.observe(self.name, time.perf_counter_ns() - self.start)
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class RequestMetrics:
+    """
+    Per-route and per-stage latency histograms, request and error counters
+    and in-flight gauges.
+
+    A thread brackets each request with ``start_request`` and
+    ``finish_request``; stages, errors and latencies recorded in between are
+    attributed to that request's route. The request's own state lives in the
+    thread's shard, so the hooks need no per-request storage of their own.
+    """
+
+    def __init__(self, prefix: str = 'survey'):
+        self.prefix = prefix
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard()
+
+    def _shard(self) -> _Shard:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._retire_dead_shards()
+                self._shards.append(shard)
+            return shard
+
+    def _retire_dead_shards(self) -> None:
+        live = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                live.append(shard)
+            else:
+                self._retired.add(shard)
+        self._shards = live
+
+    def start_request(self, route: str) -> None:
+        """Mark a request on ``route`` as in flight and start timing it"""
+        shard = self._shard()
+        shard.route = route
+        shard.view_end = 0
+        shard.status = 500  # unless a response says otherwise
+        shard.started[route] = shard.started.get(route, 0) + 1
+        shard.start = time.perf_counter_ns()
+
+    def end_view(self, view_start: int) -> int:
+        """
+        Record the view's latency; time from here to ``finish_request`` is
+        recorded as the ``after_request`` stage.
+
+        Returns:
+            int: View latency in nanoseconds
+        """
+        shard = self._shard()
+        shard.view_end = time.perf_counter_ns()
+        elapsed = shard.view_end - view_start
+        self.observe('view', elapsed)
+        return elapsed
+
+    def set_status(self, status: int) -> None:
+        """Set the status code of the current request's response"""
+        self._shard().status = status
+
+    def finish_request(self) -> int:
+        """
+        Record the end of the current request.
+
+        Returns:
+            int: Request latency in nanoseconds
+        """
+        now = time.perf_counter_ns()
+        shard = self._shard()
+        if shard.view_end:
+            self.observe('after_request', now - shard.view_end)
+        key = (shard.route, shard.status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        elapsed = now - shard.start
+        self.observe(TOTAL, elapsed)
+        return elapsed
+
+    def observe(self, stage: str, elapsed_ns: int) -> None:
+        """Add a stage latency for the current request's route"""
+        shard = self._shard()
+        key = (shard.route, stage)
+        histogram = shard.histograms.get(key)
+        if histogram is None:
+            histogram = shard.histograms[key] = [0] * _HISTOGRAM_SIZE
+        histogram[bisect_left(_BOUNDS_NS, elapsed_ns)] += 1
+        histogram[_SUM] += elapsed_ns
+
+    def stage(self, name: str) -> _Stage:
+        """Time the enclosed block as stage ``name`` of the current request"""
+        return _Stage(self, name)
+
+    def count_error(self, error_type: str) -> None:
+        """Count an error response of the current request by its ``error_type``"""
+        shard = self._shard()
+        key = (shard.route, error_type)
+        shard.errors[key] = shard.errors.get(key, 0) + 1
+
+    def collect(self) -> _Shard:
+        """Return the sum of every thread's counters"""
+        totals = _Shard()
+        with self._lock:
+            self._retire_dead_shards()
+            totals.add(self._retired)
+            for shard in self._shards:
+                totals.add(shard)
+        return totals
+
+    def _histogram_lines(self, name: str, labels: str, histogram: List[int]) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}'
+        cumulative += histogram[len(_BOUNDS_NS)]
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {histogram[_SUM] / 1e9:.9f}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        totals = self.collect()
+        prefix = self.prefix
+        lines = []
+
+        lines.append(f'# HELP {prefix}_request_duration_seconds Request latency by route')
+        lines.append(f'# TYPE {prefix}_request_duration_seconds histogram')
+        for (route, stage), histogram in sorted(totals.histograms.items()):
+            if stage == TOTAL:
+                lines.extend(self._histogram_lines(
+                    f'{prefix}_request_duration_seconds', f'route="{_escape(route)}"', histogram))
+
+        lines.append(f'# HELP {prefix}_stage_duration_seconds Latency of each stage of request handling')
+        lines.append(f'# TYPE {prefix}_stage_duration_seconds histogram')
+        for (route, stage), histogram in sorted(totals.histograms.items()):
+            if stage != TOTAL:
+                lines.extend(self._histogram_lines(
+                    f'{prefix}_stage_duration_seconds',
+                    f'route="{_escape(route)}",stage="{_escape(stage)}"', histogram))
+
+        lines.append(f'# HELP {prefix}_requests_total Completed requests by route and status')
+        lines.append(f'# TYPE {prefix}_requests_total counter')
+        finished: Dict[str, int] = {}
+        for (route, status), count in sorted(totals.requests.items()):
+            finished[route] = finished.get(route, 0) + count
+            lines.append(f'{prefix}_requests_total{{route="{_escape(route)}",status="{status}"}} {count}')
+
+        lines.append(f'# HELP {prefix}_requests_in_flight Requests currently being handled by route')
+        lines.append(f'# TYPE {prefix}_requests_in_flight gauge')
+        for route, started in sorted(totals.started.items()):
+            lines.append(f'{prefix}_requests_in_flight{{route="{_escape(route)}"}} '
+                         f'{started - finished.get(route, 0)}')
+
+        lines.append(f'# HELP {prefix}_request_errors_total Error responses by route and error type')
+        lines.append(f'# TYPE {prefix}_request_errors_total counter')
+        for (route, error_type), count in sorted(totals.errors.items()):
+            lines.append(f'{prefix}_request_errors_total{{route="{_escape(route)}",'
+                         f'error_type="{_escape(error_type)}"}} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+class SlowRequestProfiler:
+    """
+    Profile a sample of requests and keep the profiles of slow ones.
+
+    Roughly ``sample_rate`` of requests, and at most ``max_per_second``, run
+    under cProfile; when one takes at least ``slow_ms`` its stats are dumped
+    to ``directory`` for ``python -m pstats``. Only the request's own thread
+    is profiled, and a request is skipped if another profiler is active.
+    """
+
+    def __init__(self, directory: Union[str, Path], sample_rate: float,
+                 slow_ms: float = 100.0, max_per_second: int = 1):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.slow_ns = int(slow_ms * 1e6)
+        self.sampler = LogSampler(sample_rate, max_per_second)
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """Return a running profiler if this request was sampled, else None"""
+        if not self.sampler.allow():
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profiler is already running
+            return None
+        return profile
+
+    def finish(self, profile: cProfile.Profile, route: str, elapsed_ns: int) -> Optional[Path]:
+        """
+        Stop ``profile`` and save it if the request was slow.
+
+        Returns:
+            Optional[Path]: The saved profile, if any
+        """
+        profile.disable()
+        if elapsed_ns < self.slow_ns:
+            return None
+        slug = re.sub(r'[^\w-]+', '_', route).strip('_') or 'root'
+        path = self.directory / f'{slug}-{time.time_ns() // 1000000}-{os.getpid()}.prof'
+        try:
+            profile.dump_stats(path)
+        except OSError as e:
+            logger.error(f"Failed to save request profile: {str(e)}")
+            return None
+        logger.warning("Slow request to %s took %.1fms, profile saved to %s", route, elapsed_ns / 1e6, path)
+        return path
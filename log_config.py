@@ -0,0 +1,239 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+
+class LogSampler:
+    """
+    Decide whether an expensive, optional log line should be written.
+
+    Lets through roughly ``sample_rate`` of the calls, and never more than
+    ``max_per_second`` in any one second (0 disables the cap). Counting is
+    deliberately lock-free, so the cap is approximate under heavy concurrency.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, max_per_second: int = 0):
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self._window = 0
+        self._count = 0
+
+    def allow(self) -> bool:
+        """Return True if the caller should emit its log line"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.max_per_second:
+            window = int(time.monotonic())
+            if window != self._window:
+                self._window = window
+                self._count = 0
+            if self._count >= self.max_per_second:
+                return False
+            self._count += 1
+        return True
+
+class _BatchFlushMixin:
+    """Let the background writer flush a handler once per batch instead of once per record"""
+    deferred = False
+
+    def flush(self) -> None:
+        if not self.deferred:
+            super().flush()
+
+class BatchRotatingFileHandler(_BatchFlushMixin, logging.handlers.RotatingFileHandler):
+    """Size-rotated log file that is flushed once per batch"""
+
+class BatchStreamHandler(_BatchFlushMixin, logging.StreamHandler):
+    """Console handler that is flushed once per batch"""
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler for the request path.
+
+    Only merges the message arguments before enqueueing; formatting is left
+    to the writer thread. When the queue is full the record is dropped and
+    counted instead of blocking the caller.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class AsyncLogWriter:
+    """Background thread that drains queued records and writes them in batches"""
+
+    _STOP = object()
+
+    def __init__(self, log_queue: queue.Queue, handlers: List[logging.Handler],
+                 batch_size: int = 4096, flush_interval: float = 0.2):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='async-log-writer', daemon=True)
+
+    def start(self) -> 'AsyncLogWriter':
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write out everything still queued and stop the thread"""
+        if self._thread.is_alive():
+            self._stopping.set()
+            self.queue.put(self._STOP)
+            self._thread.join(timeout)
+        for handler in self.handlers:
+            handler.close()
+
+    def _next_batch(self) -> list:
+        # Block for the first record, then let a batch accumulate so the
+        # writer wakes once per interval rather than once per record
+        batch = [self.queue.get()]
+        if batch[0] is not self._STOP:
+            self._stopping.wait(self.flush_interval)
+        while len(batch) < self.batch_size and batch[-1] is not self._STOP:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list) -> None:
+        for handler in self.handlers:
+            handler.deferred = True
+        try:
+            for position, record in enumerate(batch, 1):
+                if record is self._STOP:
+                    continue
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+                if position % 32 == 0:
+                    time.sleep(0)  # give request threads waiting on the GIL a turn
+        finally:
+            for handler in self.handlers:
+                handler.deferred = False
+                handler.flush()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            self._write(batch)
+            if batch[-1] is self._STOP:
+                return
+
+_active_writer: Optional[AsyncLogWriter] = None
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+def debug_sampler_from_env() -> LogSampler:
+    """Build the sampler for verbose request dumps from SURVEY_LOG_DEBUG_* settings"""
+    return LogSampler(
+        _env_float('SURVEY_LOG_DEBUG_SAMPLE_RATE', 1.0),
+        int(_env_float('SURVEY_LOG_DEBUG_MAX_PER_SECOND', 0))
+    )
+
+def configure_logging(mode: Optional[str] = None, level: Optional[str] = None,
+                      log_dir: str = '.', console: bool = True, per_process: bool = False) -> logging.Logger:
+    """
+    Configure the root logger for the API.
+
+    ``sync`` mode writes every record inline to ``api.log``, a daily file and
+    stdout. ``async`` mode only enqueues records on the request path; a
+    background writer formats them, writes them in batches to a size-rotated
+    ``api.log`` and stdout, and flushes once per batch. Rotation renames the
+    file under every other process writing to it, so processes that share a
+    log directory pass ``per_process`` to write ``api.<pid>.log`` instead.
+
+    Unset arguments fall back to SURVEY_LOG_MODE (default ``sync``),
+    SURVEY_LOG_LEVEL (default ``DEBUG``), SURVEY_LOG_MAX_BYTES,
+    SURVEY_LOG_BACKUP_COUNT and SURVEY_LOG_QUEUE_SIZE.
+
+    Args:
+        mode (Optional[str]): ``sync`` or ``async``
+        level (Optional[str]): Root log level name
+        log_dir (str): Directory for the log files
+        console (bool): Whether to also log to stdout
+        per_process (bool): Whether async mode writes to a file of this
+            process's own
+
+    Returns:
+        logging.Logger: The configured root logger
+
+    Raises:
+        ValueError: If the mode is unknown
+    """
+    global _active_writer
+    mode = (mode or os.environ.get('SURVEY_LOG_MODE', 'sync')).lower()
+    level = (level or os.environ.get('SURVEY_LOG_LEVEL', 'DEBUG')).upper()
+    if mode not in ('sync', 'async'):
+        raise ValueError(f"Unknown logging mode: {mode}")
+
+    previous_writer, _active_writer = _active_writer, None
+    log_dir = Path(log_dir)
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    if mode == 'sync':
+        handlers: List[logging.Handler] = [
+            logging.FileHandler(log_dir / 'api.log'),
+            logging.FileHandler(log_dir / f'api_{datetime.now().strftime("%Y%m%d")}.log')  # Daily log file
+        ]
+        if console:
+            handlers.append(logging.StreamHandler(sys.stdout))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+    else:
+        writer_handlers: List[logging.Handler] = [
+            BatchRotatingFileHandler(
+                log_dir / (f'api.{os.getpid()}.log' if per_process else 'api.log'),
+                maxBytes=int(_env_float('SURVEY_LOG_MAX_BYTES', 50 * 1024 * 1024)),
+                backupCount=int(_env_float('SURVEY_LOG_BACKUP_COUNT', 5))
+            )
+        ]
+        if console:
+            writer_handlers.append(BatchStreamHandler(sys.stdout))
+        for handler in writer_handlers:
+            handler.setFormatter(formatter)
+        log_queue: queue.Queue = queue.Queue(int(_env_float('SURVEY_LOG_QUEUE_SIZE', 100000)))
+        _active_writer = AsyncLogWriter(log_queue, writer_handlers).start()
+        handlers = [NonBlockingQueueHandler(log_queue)]
+
+    logging.basicConfig(level=level, handlers=handlers, force=True)
+    if previous_writer is not None:
+        previous_writer.stop()
+    root = logging.getLogger()
+    root.debug("Logging configured in %s mode at %s level", mode, level)
+    return root
+
+def shutdown_logging() -> None:
+    """Flush and stop the background writer, if one is running"""
+    global _active_writer
+    if _active_writer is not None:
+        _active_writer.stop()
+        _active_writer = None
+
+atexit.register(shutdown_logging)
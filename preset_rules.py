@@ -0,0 +1,252 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Mapping, Optional, Tuple, Union
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11 ships without a TOML parser
+    tomllib = None
+
+logger = logging.getLogger(__name__)
+
+class PresetRule:
+    """Compiled, immutable definition of a single survey metric and its preset"""
+    __slots__ = ('key', 'name', 'threshold', 'preset', 'description', 'required', 'pass_table', '_fragments')
+
+    def __init__(self, key: str, name: str, threshold: int, preset: str,
+                 description: str, required: bool = False):
+        if isinstance(threshold, bool) or not isinstance(threshold, int) or not 0 <= threshold <= 100:
+            raise ValueError(f"Threshold for {key} must be an integer between 0 and 100")
+        self.key = key
+        self.name = name
+        self.threshold = threshold
+        self.preset = preset
+        self.description = description
+        self.required = required
+        # bytes.translate table mapping a packed score to 1 when it meets the threshold;
+        # bytes above 100, including the missing-score marker, map to 0
+        self.pass_table = bytes(1 if threshold <= value <= 100 else 0 for value in range(256))
+        self._fragments: Optional[Tuple[Optional[bytes], ...]] = None
+
+    @property
+    def fragments(self) -> Tuple[Optional[bytes], ...]:
+        """
+        Pre-encoded JSON payload for every score from 0 to 100, or None below the threshold.
+
+        Encoded the way ``jsonify`` encodes (sorted keys, compact separators)
+        and built on first use.
+        """
+        fragments = self._fragments
+        if fragments is None:
+            fragments = self._fragments = tuple(
+                json.dumps(self.payload(score), sort_keys=True, separators=(',', ':')).encode('utf-8')
+                if score >= self.threshold else None
+                for score in range(101)
+            )
+        return fragments
+
+    def payload(self, score: int) -> Dict[str, Any]:
+        """Build the preset configuration returned for a score at or above the threshold"""
+        return {
+            'name': self.name,
+            'preset': self.preset,
+            'description': self.description,
+            'score': score,
+            'threshold': self.threshold,
+            'exceeded_by': score - self.threshold
+        }
+
+    def definition(self) -> Dict[str, Any]:
+        """Return the rule as a plain dictionary, as found in a presets file"""
+        return {
+            'name': self.name,
+            'threshold': self.threshold,
+            'preset': self.preset,
+            'description': self.description,
+            'required': self.required
+        }
+
+class PresetRuleTable:
+    """
+    Read-only table of compiled preset rules.
+
+    Tables are never modified once built; a reload compiles a new table and
+    swaps the reference, so readers need no locking.
+    """
+    __slots__ = ('rules', 'keys', 'index', 'required', 'version', 'loaded_at', 'source')
+
+    def __init__(self, rules: Iterable[PresetRule], source: Optional[str] = None):
+        self.rules: Tuple[PresetRule, ...] = tuple(rules)
+        self.keys: Tuple[str, ...] = tuple(rule.key for rule in self.rules)
+        self.index: Dict[str, int] = {key: position for position, key in enumerate(self.keys)}
+        self.required: Tuple[str, ...] = tuple(rule.key for rule in self.rules if rule.required)
+        definitions = json.dumps(self.describe(), sort_keys=True).encode('utf-8')
+        self.version = hashlib.sha1(definitions).hexdigest()[:16]
+        self.loaded_at = datetime.now().isoformat()
+        self.source = source
+
+    def get(self, key: str) -> Optional[PresetRule]:
+        """Return the rule for a metric key, or None if it is unknown"""
+        position = self.index.get(key)
+        return None if position is None else self.rules[position]
+
+    def encode_presets(self, user_metrics: Mapping[str, int]) -> bytes:
+        """
+        Encode the presets selected by validated scores as a JSON array.
+
+        Raises:
+            KeyError: If a metric key is not in the table
+        """
+        fragments = []
+        for metric, score in user_metrics.items():
+            fragment = self.rules[self.index[metric]].fragments[score]
+            if fragment is not None:
+                fragments.append(fragment)
+        return b'[' + b','.join(fragments) + b']'
+
+    def describe(self) -> Dict[str, Dict[str, Any]]:
+        """Return metric definitions keyed by metric, in table order"""
+        return {rule.key: rule.definition() for rule in self.rules}
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.index
+
+    def __iter__(self) -> Iterator[PresetRule]:
+        return iter(self.rules)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+def compile_rules(metrics: Mapping[str, Any], required: Iterable[str] = (),
+                  source: Optional[str] = None) -> PresetRuleTable:
+    """
+    Compile metric definitions into a rule table.
+
+    Args:
+        metrics (Mapping[str, Any]): Metric key to either a ``SurveyMetric``
+            or a dictionary with name, threshold, preset and description
+        required (Iterable[str]): Metric keys every submission must provide,
+            in addition to definitions flagged ``required``
+        source (Optional[str]): Where the definitions came from, for logging
+
+    Returns:
+        PresetRuleTable: The compiled table
+
+    Raises:
+        ValueError: If a definition is incomplete or has an invalid threshold
+    """
+    required = set(required)
+    rules = []
+    for key, metric in metrics.items():
+        if isinstance(metric, Mapping):
+            try:
+                rule = PresetRule(
+                    key,
+                    metric['name'],
+                    metric['threshold'],
+                    metric['preset'],
+                    metric.get('description', ''),
+                    bool(metric.get('required', False)) or key in required
+                )
+            except KeyError as e:
+                raise ValueError(f"Metric {key} is missing field {e}")
+        else:
+            rule = PresetRule(key, metric.name, metric.threshold, metric.preset,
+                              metric.description, key in required)
+        rules.append(rule)
+    return PresetRuleTable(rules, source)
+
+def load_rules_file(path: Union[str, Path]) -> PresetRuleTable:
+    """
+    Load and compile preset rules from a JSON or TOML file.
+
+    The file holds a ``metrics`` table keyed by metric, for example::
+
+        {"metrics": {"metric_a": {"name": "Emotional Intelligence", "threshold": 70,
+                                  "preset": "Supportive and Empathetic",
+                                  "description": "...", "required": true}}}
+
+    Args:
+        path (Union[str, Path]): Path to a ``.json`` or ``.toml`` file
+
+    Returns:
+        PresetRuleTable: The compiled table
+
+    Raises:
+        ValueError: If the file cannot be parsed or holds invalid definitions
+    """
+    path = Path(path)
+    if path.suffix == '.toml' and tomllib is None:
+        raise ValueError("TOML presets files require Python 3.11 or newer")
+    try:
+        if path.suffix == '.toml':
+            with open(path, 'rb') as f:
+                document = tomllib.load(f)
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                document = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Could not read presets file {path}: {e}")
+
+    metrics = document.get('metrics') if isinstance(document, dict) else None
+    if not isinstance(metrics, dict) or not metrics:
+        raise ValueError(f"Presets file {path} must define a non-empty 'metrics' table")
+    for key, metric in metrics.items():
+        if not isinstance(metric, dict):
+            raise ValueError(f"Definition for metric {key} in {path} must be a table")
+    return compile_rules(metrics, source=str(path))
+
+class RuleFileWatcher:
+    """Background thread that recompiles a presets file whenever it changes"""
+
+    def __init__(self, path: Union[str, Path], on_reload: Callable[[PresetRuleTable], Any],
+                 interval: float = 5.0):
+        self.path = Path(path)
+        self.on_reload = on_reload
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._signature = self._stat()
+        self._thread = threading.Thread(target=self._run, name='preset-rules-watcher', daemon=True)
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self) -> 'RuleFileWatcher':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def check(self) -> bool:
+        """
+        Reload the file if it changed since the last check.
+
+        Returns:
+            bool: True if a new table was installed
+        """
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        try:
+            table = load_rules_file(self.path)
+            self.on_reload(table)
+        except ValueError as e:
+            logger.error(f"Keeping current presets, reload failed: {str(e)}")
+            return False
+        logger.info(f"Reloaded {len(table)} presets from {self.path} (version {table.version})")
+        return True
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.check()
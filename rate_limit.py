@@ -0,0 +1,245 @@
+"""
+Token-bucket rate limiting per client and route.
+
+Each client gets a bucket per route that holds up to ``burst`` tokens and
+refills at ``rate`` tokens per second; a request spends one token or is
+refused with the time until one will be available. Checks are O(1).
+
+``TokenBucketLimiter`` keeps buckets in this process, spread over shards
+that each have their own lock and LRU order, so threads rarely contend and
+idle buckets are evicted to keep memory bounded. ``SharedTokenBucketLimiter``
+keeps them in a memory-mapped file guarded by per-set ``fcntl`` record
+locks, so every worker process on the host draws from the same budget.
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+_PERIODS = {'second': 1.0, 'minute': 60.0, 'hour': 3600.0, 'day': 86400.0}
+
+class RateLimit:
+    """Sustained ``rate`` in requests per second with bursts of up to ``burst`` requests"""
+    __slots__ = ('rate', 'burst')
+
+    def __init__(self, rate: float, burst: float):
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate limits need a positive rate and a burst of at least 1")
+        self.rate = rate
+        self.burst = burst
+
+    def __repr__(self) -> str:
+        return f'RateLimit(rate={self.rate:g}, burst={self.burst:g})'
+
+def parse_rate_limit(spec: str) -> Optional[RateLimit]:
+    """
+    Parse ``COUNT/PERIOD[:BURST]``, e.g. ``50/second:100`` or ``600/minute``.
+
+    Without a burst, a whole period's worth of requests may arrive at once.
+    ``off`` means unlimited and returns None.
+
+    Raises:
+        ValueError: If the spec is malformed
+    """
+    spec = spec.strip()
+    if spec == 'off':
+        return None
+    try:
+        amount, _, burst = spec.partition(':')
+        count, _, period = amount.partition('/')
+        count = float(count)
+        rate = count / _PERIODS[period.strip() or 'second']
+        return RateLimit(rate, float(burst) if burst else count)
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid rate limit {spec!r}, expected COUNT/PERIOD[:BURST] or off")
+
+def parse_rate_limits(spec: str) -> Dict[str, Optional[RateLimit]]:
+    """
+    Parse ``;``-separated ``ROUTE=LIMIT`` entries into limits by route.
+
+    ``default`` applies to routes without an entry of their own.
+
+    Raises:
+        ValueError: If an entry is malformed
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(';'))):
+        route, separator, limit = entry.partition('=')
+        if not separator:
+            raise ValueError(f"Invalid rate limit entry {entry!r}, expected ROUTE=LIMIT")
+        limits[route.strip()] = parse_rate_limit(limit)
+    return limits
+
+class TokenBucketLimiter:
+    """
+    In-process token buckets, sharded by key.
+
+    Each shard keeps its buckets in least-recently-used order. Buckets idle
+    long enough to have refilled completely are indistinguishable from new
+    ones and are dropped as they reach the front; beyond ``max_keys``
+    buckets in total the least recently used are dropped regardless.
+    """
+
+    def __init__(self, shards: int = 64, max_keys: int = 100000):
+        self._shards: List[OrderedDict] = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._max_per_shard = max(max_keys // shards, 1)
+
+    def acquire(self, key: str, limit: RateLimit) -> float:
+        """
+        Spend one token from ``key``'s bucket.
+
+        Returns:
+            float: 0 if the request may proceed, otherwise seconds until
+            the bucket will have a token
+        """
+        index = hash(key) % len(self._shards)
+        buckets = self._shards[index]
+        now = time.monotonic()
+        with self._locks[index]:
+            bucket = buckets.get(key)
+            if bucket is None:
+                tokens = limit.burst
+            else:
+                tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+                buckets.move_to_end(key)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / limit.rate
+            # Third field: when the bucket will be full again, after which it can be forgotten
+            buckets[key] = [tokens, now, now + (limit.burst - tokens) / limit.rate]
+
+            while buckets:
+                oldest = next(iter(buckets.values()))
+                if oldest[2] > now and len(buckets) <= self._max_per_shard:
+                    break
+                buckets.popitem(last=False)
+        return wait
+
+    def __len__(self) -> int:
+        return sum(len(buckets) for buckets in self._shards)
+
+class SharedTokenBucketLimiter:
+    """
+    Token buckets in a memory-mapped file shared by every process on the host.
+
+    The file is a fixed-size hash table of ``sets`` x ``ways`` slots, so
+    memory never grows; a new key takes an empty slot in its set or the
+    least recently used one. Each set is locked with an ``fcntl`` record
+    lock for other processes and one of ``locks`` thread locks for other
+    threads of this process. Keys are hashed with BLAKE2b because Python's
+    ``hash`` differs between processes. Buckets are stamped with the wall
+    clock, because the file can outlive the processes and the host's
+    uptime, and a clock that steps back refills nothing rather than
+    draining buckets.
+    """
+
+    MAGIC = b'SVRL0001'
+    _HEADER = struct.Struct('<8sII')  # magic, sets, ways
+    _SLOT = struct.Struct('<Qdd')  # key hash (0 when empty), tokens, last update
+
+    def __init__(self, path: Union[str, os.PathLike], sets: int = 16384, ways: int = 4, locks: int = 64):
+        if fcntl is None:
+            raise ValueError("The shared rate limiter needs fcntl, which is not available on this platform")
+        self.sets = sets
+        self.ways = ways
+        self._set_size = self._SLOT.size * ways
+        size = self._HEADER.size + self._set_size * sets
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self._HEADER.size, 0)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, self._HEADER.pack(self.MAGIC, sets, ways), 0)
+            header = self._HEADER.unpack(os.pread(self._fd, self._HEADER.size, 0))
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self._HEADER.size, 0)
+        if header != (self.MAGIC, sets, ways):
+            os.close(self._fd)
+            raise ValueError(f"{path} is not a rate limit table with {sets} sets of {ways} slots")
+
+        self._map = mmap.mmap(self._fd, size)
+        self._locks = [threading.Lock() for _ in range(locks)]
+
+    def acquire(self, key: str, limit: RateLimit) -> float:
+        """
+        Spend one token from ``key``'s bucket.
+
+        Returns:
+            float: 0 if the request may proceed, otherwise seconds until
+            the bucket will have a token
+        """
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        set_index = key_hash % self.sets
+        offset = self._HEADER.size + set_index * self._set_size
+        slot_unpack, slot_pack, slot_size = self._SLOT.unpack_from, self._SLOT.pack_into, self._SLOT.size
+
+        with self._locks[set_index % len(self._locks)]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self._set_size, offset)
+            try:
+                now = time.time()
+                victim, victim_last, tokens = offset, math.inf, None
+                for slot in range(offset, offset + self._set_size, slot_size):
+                    slot_hash, slot_tokens, slot_last = slot_unpack(self._map, slot)
+                    if slot_hash == key_hash:
+                        victim = slot
+                        tokens = min(limit.burst, slot_tokens + max(0.0, now - slot_last) * limit.rate)
+                        break
+                    if slot_last < victim_last:  # empty slots have last == 0
+                        victim, victim_last = slot, slot_last
+                if tokens is None:
+                    tokens = limit.burst
+
+                if tokens >= 1:
+                    tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = (1 - tokens) / limit.rate
+                slot_pack(self._map, victim, key_hash, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self._set_size, offset)
+        return wait
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+class RateLimiter:
+    """
+    Apply per-route limits to clients with a token-bucket backend.
+
+    Routes without their own limit use the ``default`` entry, if any.
+    """
+
+    def __init__(self, limits: Dict[str, Optional[RateLimit]],
+                 backend: Union[TokenBucketLimiter, SharedTokenBucketLimiter, None] = None):
+        self.limits = limits
+        self.default = limits.get('default')
+        self.backend = backend if backend is not None else TokenBucketLimiter()
+
+    def check(self, route: str, client: str) -> float:
+        """
+        Count a request from ``client`` to ``route``.
+
+        Returns:
+            float: 0 if it is within the route's limit, otherwise seconds
+            until the client may retry
+        """
+        limit = self.limits.get(route, self.default)
+        if limit is None:
+            return 0.0
+        return self.backend.acquire(f'{route} {client}', limit)
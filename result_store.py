@@ -0,0 +1,278 @@
+"""
+Append-only, segmented storage for survey results.
+
+Records are appended to segment files as a small binary header (timestamp
+and payload length) followed by compact JSON. Each writer process owns its
+own segments, rotates them by size and fsyncs in groups. When a segment is
+sealed a sidecar ``.idx`` file records its time range, record count and
+sparse offset checkpoints, so readers can skip or seek into segments by
+time without decoding payloads.
+"""
+import json
+import logging
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAGIC = b'SVSEG001'
+RECORD_HEADER = struct.Struct('<dI')  # timestamp (epoch seconds), payload length
+CHECKPOINT_EVERY = 1024
+_SEGMENT_NAME = re.compile(r'^segment-(?P<writer>[\w.-]+)-(?P<seq>\d{6})\.seg$')
+
+class ResultStore:
+    """
+    Writer for an append-only result store.
+
+    Appends are buffered and made durable with one fsync per ``sync_every``
+    records or ``sync_interval`` seconds, whichever comes first. Safe to use
+    from several threads; separate processes must use distinct ``writer_id``
+    values (the process id by default).
+    """
+
+    def __init__(self, directory: Union[str, Path], segment_size: int = 64 * 1024 * 1024,
+                 sync_every: int = 256, sync_interval: float = 1.0,
+                 writer_id: Optional[str] = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.writer_id = writer_id or str(os.getpid())
+        self._lock = threading.Lock()
+        self._file = None
+        self._seq = self._last_sequence()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._index: Dict[str, Any] = {}
+
+    def _last_sequence(self) -> int:
+        sequences = [
+            int(match.group('seq'))
+            for match in (_SEGMENT_NAME.match(path.name) for path in self.directory.iterdir())
+            if match and match.group('writer') == self.writer_id
+        ]
+        return max(sequences, default=0)
+
+    def _open_segment(self) -> None:
+        self._seq += 1
+        path = self.directory / f'segment-{self.writer_id}-{self._seq:06d}.seg'
+        self._file = open(path, 'xb')
+        self._file.write(SEGMENT_MAGIC)
+        self._index = {
+            'segment': path.name,
+            'count': 0,
+            'first_ts': None,
+            'last_ts': None,
+            'ordered': True,
+            'checkpoints': []
+        }
+        logger.info("Opened result segment %s", path)
+
+    def _seal_segment(self) -> None:
+        self._sync()
+        path = Path(self._file.name)
+        self._index['size'] = self._file.tell()
+        self._file.close()
+        self._file = None
+        index_path = path.with_suffix('.idx')
+        tmp_path = index_path.with_suffix('.idx.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, index_path)
+        logger.info("Sealed result segment %s with %s records", path, self._index['count'])
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, user_metrics: Dict[str, int], chatbot_presets: List[Dict[str, Any]],
+               timestamp: Optional[float] = None) -> None:
+        """
+        Append one survey result.
+
+        Args:
+            user_metrics (Dict[str, int]): Submitted metric scores
+            chatbot_presets (List[Dict[str, Any]]): Presets selected for them
+            timestamp (Optional[float]): Epoch seconds, defaults to now
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        payload = json.dumps(
+            {'user_metrics': user_metrics, 'selected_presets': chatbot_presets},
+            separators=(',', ':')
+        ).encode('utf-8')
+
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            elif self._file.tell() + RECORD_HEADER.size + len(payload) > self.segment_size:
+                self._seal_segment()
+                self._open_segment()
+
+            index = self._index
+            if index['count'] % CHECKPOINT_EVERY == 0:
+                index['checkpoints'].append([timestamp, self._file.tell()])
+            if index['last_ts'] is not None and timestamp < index['last_ts']:
+                index['ordered'] = False
+            if index['first_ts'] is None:
+                index['first_ts'] = timestamp
+            index['last_ts'] = timestamp if index['last_ts'] is None else max(index['last_ts'], timestamp)
+            index['count'] += 1
+
+            self._file.write(RECORD_HEADER.pack(timestamp, len(payload)))
+            self._file.write(payload)
+            self._unsynced += 1
+            if (self._unsynced >= self.sync_every
+                    or time.monotonic() - self._last_sync >= self.sync_interval):
+                self._sync()
+
+    def flush(self) -> None:
+        """Make every appended record durable"""
+        with self._lock:
+            if self._file is not None and self._unsynced:
+                self._sync()
+
+    def close(self) -> None:
+        """Seal the open segment"""
+        with self._lock:
+            if self._file is not None:
+                self._seal_segment()
+
+class BackgroundResultWriter:
+    """
+    Hand results to a ResultStore from a background thread.
+
+    ``submit`` never blocks the caller: when the queue is full the result is
+    dropped and counted in ``dropped``.
+    """
+
+    _STOP = object()
+
+    def __init__(self, store: ResultStore, max_queue: int = 10000):
+        self.store = store
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name='result-store-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, user_metrics: Dict[str, int], chatbot_presets: List[Dict[str, Any]]) -> bool:
+        """
+        Queue a result for writing.
+
+        Returns:
+            bool: False if the result was dropped because the queue is full
+        """
+        try:
+            self._queue.put_nowait((time.time(), user_metrics, chatbot_presets))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Write everything still queued and seal the store"""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+        self.store.close()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.store.sync_interval)
+            except queue.Empty:
+                self.store.flush()
+                continue
+            if item is self._STOP:
+                return
+            timestamp, user_metrics, chatbot_presets = item
+            try:
+                self.store.append(user_metrics, chatbot_presets, timestamp)
+            except OSError as e:
+                logger.error("Failed to persist survey result: %s", e)
+
+class ResultStoreReader:
+    """Memory-mapped reader over every segment in a result store directory"""
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+
+    def segments(self) -> List[Tuple[Path, Optional[Dict[str, Any]]]]:
+        """Return each segment with its sidecar index, or None while it is still being written"""
+        segments = []
+        for path in sorted(self.directory.glob('segment-*.seg')):
+            index_path = path.with_suffix('.idx')
+            index = None
+            if index_path.exists():
+                with open(index_path) as f:
+                    index = json.load(f)
+            segments.append((path, index))
+        return segments
+
+    def iter_raw(self, start: Optional[float] = None,
+                 end: Optional[float] = None) -> Iterator[Tuple[float, bytes]]:
+        """
+        Yield ``(timestamp, payload)`` for records with ``start <= timestamp < end``.
+
+        Payloads are returned undecoded; segments whose index shows them to be
+        outside the range are skipped without being opened.
+        """
+        for path, index in self.segments():
+            if index is not None and index['count'] == 0:
+                continue
+            if index is not None and start is not None and index['last_ts'] < start:
+                continue
+            if index is not None and end is not None and index['first_ts'] >= end:
+                continue
+            yield from self._scan_segment(path, index, start, end)
+
+    def _scan_segment(self, path: Path, index: Optional[Dict[str, Any]], start: Optional[float],
+                      end: Optional[float]) -> Iterator[Tuple[float, bytes]]:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= len(SEGMENT_MAGIC):
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                    logger.warning("Skipping %s: not a result segment", path)
+                    return
+
+                offset = len(SEGMENT_MAGIC)
+                ordered = index is not None and index['ordered']
+                if ordered and start is not None:
+                    for checkpoint_ts, checkpoint_offset in index['checkpoints']:
+                        if checkpoint_ts >= start:
+                            break
+                        offset = checkpoint_offset
+
+                while offset + RECORD_HEADER.size <= size:
+                    timestamp, length = RECORD_HEADER.unpack_from(mm, offset)
+                    payload_start = offset + RECORD_HEADER.size
+                    offset = payload_start + length
+                    if offset > size:
+                        break  # record still being written
+                    if end is not None and timestamp >= end:
+                        if ordered:
+                            return
+                        continue
+                    if start is not None and timestamp < start:
+                        continue
+                    yield timestamp, mm[payload_start:offset]
+
+    def iter_results(self, start: Optional[float] = None,
+                     end: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Yield decoded results, shaped like ``save_results`` output, within a time range"""
+        for timestamp, payload in self.iter_raw(start, end):
+            result = json.loads(payload)
+            result['timestamp'] = datetime.fromtimestamp(timestamp).isoformat()
+            yield result
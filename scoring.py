@@ -0,0 +1,185 @@
+"""
+Server-side scoring of raw survey answers.
+
+Ports ``calculateTechnicalProficiency``, ``calculateTrustLevel`` and
+``calculateInteractionStyle`` from ``index.html``. Answers are turned into a
+feature matrix (one column per factor) and multiplied by the factor weights
+of each survey metric, so a single survey and a large batch go through the
+same code. Each metric adds its weighted factors in the order the
+JavaScript does before scaling by 100, which keeps results identical to
+the browser down to the last bit.
+"""
+import math
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+# Answer options of the survey form
+FREQUENCY_OPTIONS = (1, 2, 3, 4, 5)
+EXPERIENCE_OPTIONS = ('yes', 'no')
+INFO_CHARACTERISTICS = (
+    'accuracy', 'objectivity', 'relevance', 'clarity', 'authority', 'creativity', 'understanding'
+)
+TRUST_INDICATORS = ('accuracy', 'objectivity', 'authority')
+CREATIVE_INDICATORS = ('creativity', 'understanding')
+
+# Feature columns derived from the answers, each normalised to 0-1
+FEATURES = (
+    'llm_familiarity',
+    'llm_experience',
+    'cross_check_frequency',
+    'trust_indicators',
+    'creative_indicators',
+)
+
+# Mirrors surveyMetrics in index.html. Factors are listed in the order the
+# JavaScript adds them, which matters for floating point parity.
+SURVEY_METRICS = {
+    'technical_proficiency': {
+        'name': 'Technical Proficiency',
+        'weight': 0.3,
+        'factors': (('llm_familiarity', 0.4), ('llm_experience', 0.3), ('cross_check_frequency', 0.3))
+    },
+    'trust_level': {
+        'name': 'Trust Level',
+        'weight': 0.35,
+        'factors': (('trust_indicators', 0.4), ('cross_check_frequency', 0.3), ('llm_familiarity', 0.3))
+    },
+    'interaction_style': {
+        'name': 'Interaction Style',
+        'weight': 0.35,
+        'factors': (('creative_indicators', 0.5), ('llm_experience', 0.5))
+    }
+}
+
+# Preset metric fed by each survey metric when scoring answers into presets
+PRESET_METRIC_MAP = {
+    'trust_level': 'metric_a',
+    'technical_proficiency': 'metric_b',
+    'interaction_style': 'metric_c',
+}
+
+# Factor matrix: for each survey metric, (feature column, weight) pairs in addition order
+FACTOR_MATRIX: Tuple[Tuple[str, Tuple[Tuple[int, float], ...]], ...] = tuple(
+    (metric, tuple((FEATURES.index(feature), weight) for feature, weight in definition['factors']))
+    for metric, definition in SURVEY_METRICS.items()
+)
+
+def _frequency(answers: Mapping[str, Any], key: str) -> float:
+    value = answers.get(key)
+    if value is None or value == '':
+        return 0.0
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, bool) or value not in FREQUENCY_OPTIONS:
+        raise ValueError(f"Invalid answer for {key}. Must be one of 1-5")
+    return value / 5
+
+def extract_features(answers: Mapping[str, Any]) -> List[float]:
+    """
+    Turn one survey's raw answers into its feature row.
+
+    Unanswered questions contribute 0, as in the browser.
+
+    Args:
+        answers (Mapping[str, Any]): Form answers: ``llm_familiarity`` and
+            ``cross_check_frequency`` (1-5), ``llm_experience`` (``yes`` or
+            ``no``) and ``info_characteristics`` (list of checked values)
+
+    Returns:
+        List[float]: One value per entry in ``FEATURES``
+
+    Raises:
+        ValueError: If an answer is not one of the form's options
+    """
+    if not isinstance(answers, Mapping):
+        raise ValueError("Answers must be an object")
+
+    experience = answers.get('llm_experience')
+    if experience not in (None, '') + EXPERIENCE_OPTIONS:
+        raise ValueError("Invalid answer for llm_experience. Must be 'yes' or 'no'")
+
+    characteristics = answers.get('info_characteristics') or []
+    if not isinstance(characteristics, list):
+        raise ValueError("Invalid answer for info_characteristics. Must be a list")
+    for characteristic in characteristics:
+        if characteristic not in INFO_CHARACTERISTICS:
+            raise ValueError(f"Unknown info_characteristics value: {characteristic}")
+    if len(set(characteristics)) != len(characteristics):
+        raise ValueError("Duplicate info_characteristics values")
+
+    return [
+        _frequency(answers, 'llm_familiarity'),
+        1.0 if experience == 'yes' else 0.0,
+        _frequency(answers, 'cross_check_frequency'),
+        sum(1 for c in characteristics if c in TRUST_INDICATORS) / len(TRUST_INDICATORS),
+        sum(1 for c in characteristics if c in CREATIVE_INDICATORS) / len(CREATIVE_INDICATORS),
+    ]
+
+def score_feature_columns(columns: Sequence[Sequence[float]]) -> Dict[str, List[float]]:
+    """
+    Multiply a feature matrix, given column by column, by the factor matrix.
+
+    Args:
+        columns (Sequence[Sequence[float]]): One column per entry in ``FEATURES``
+
+    Returns:
+        Dict[str, List[float]]: Column of 0-100 scores for each survey metric
+    """
+    row_count = len(columns[0]) if columns else 0
+    scores = {}
+    for metric, factors in FACTOR_MATRIX:
+        column = [0.0] * row_count
+        for feature, weight in factors:
+            column = [score + value * weight for score, value in zip(column, columns[feature])]
+        scores[metric] = [score * 100 for score in column]
+    return scores
+
+def score_answers_batch(answers: Sequence[Mapping[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Score many surveys' raw answers at once.
+
+    Args:
+        answers (Sequence[Mapping[str, Any]]): Raw answers, one per survey
+
+    Returns:
+        List[Dict[str, Any]]: One result per survey, either
+        ``{'index', 'success': True, 'scores'}`` or
+        ``{'index', 'success': False, 'error', 'error_type'}``
+    """
+    rows: List[List[float]] = []
+    valid_rows: List[int] = []
+    results: List[Dict[str, Any]] = []
+    for index, survey in enumerate(answers):
+        try:
+            rows.append(extract_features(survey))
+            valid_rows.append(index)
+            results.append({'index': index, 'success': True})
+        except ValueError as e:
+            results.append({'index': index, 'success': False, 'error': str(e), 'error_type': 'ValidationError'})
+
+    columns = [list(column) for column in zip(*rows)] or [[] for _ in FEATURES]
+    scores = score_feature_columns(columns)
+    for position, index in enumerate(valid_rows):
+        results[index]['scores'] = {metric: scores[metric][position] for metric in scores}
+    return results
+
+def score_answers(answers: Mapping[str, Any]) -> Dict[str, float]:
+    """
+    Score one survey's raw answers.
+
+    Returns:
+        Dict[str, float]: 0-100 score for each survey metric
+
+    Raises:
+        ValueError: If an answer is not one of the form's options
+    """
+    result = score_answers_batch([answers])[0]
+    if not result['success']:
+        raise ValueError(result['error'])
+    return result['scores']
+
+def to_preset_metrics(scores: Mapping[str, float]) -> Dict[str, int]:
+    """Map survey metric scores onto preset metrics, rounding half up to whole scores"""
+    return {
+        PRESET_METRIC_MAP[metric]: int(math.floor(score + 0.5))
+        for metric, score in scores.items() if metric in PRESET_METRIC_MAP
+    }
@@ -0,0 +1,370 @@
+"""
+Pre-forking production server for the Survey Calculator API.
+
+The master process binds one listening socket and forks a pool of worker
+processes that accept from it. Each worker imports the app after the fork
+and serves it with a threaded HTTP/1.1 server that keeps connections
+alive. The master restarts workers that crash or retire after
+``max_requests``, restarts the pool on SIGHUP and shuts down gracefully on
+SIGTERM or SIGINT. Throughput scales with the number of workers because
+each one has its own interpreter and GIL.
+
+Settings come from the command line or SURVEY_HOST, SURVEY_PORT,
+SURVEY_WORKERS, SURVEY_MAX_REQUESTS, SURVEY_GRACEFUL_TIMEOUT,
+SURVEY_KEEPALIVE and SURVEY_BACKLOG.
+
+Usage:
+    python server.py --workers 8 --port 8000
+"""
+import argparse
+import io
+import itertools
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+from werkzeug.wsgi import LimitedStream
+
+logger = logging.getLogger(__name__)
+
+# A worker that dies sooner than this after starting is restarted with a delay
+MIN_WORKER_LIFETIME = 1.0
+
+# Message a recycling worker sends the master; shorter than PIPE_BUF, so writes are atomic
+_PID = struct.Struct('=i')
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    HTTP/1.1 request handler that keeps connections open between requests.
+
+    Werkzeug's handler closes every connection because, after responding,
+    it discards whatever is left in the socket, which would swallow the
+    next request. Here the app reads the body through a stream limited to
+    Content-Length, werkzeug's discard loop is pointed at an empty buffer,
+    and only the unread part of the body is drained afterwards. Requests
+    with chunked bodies, or that ask to close, still close. Idle
+    connections are dropped after ``timeout`` seconds, or as soon as a
+    ``PoolServer`` shuts down.
+    """
+    protocol_version = 'HTTP/1.1'
+    timeout = 5
+    keep_alive = False
+    # Headers and body go out in separate writes; without this the body waits on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def _set_idle(self, idle: bool) -> None:
+        set_idle = getattr(self.server, 'set_idle', None)
+        if set_idle is not None:
+            set_idle(self.connection, idle)
+
+    def handle_one_request(self) -> None:
+        # Idle until the next request line arrives
+        self._set_idle(True)
+        super().handle_one_request()
+
+    def parse_request(self) -> bool:
+        self._set_idle(False)
+        return super().parse_request()
+
+    def finish(self) -> None:
+        self._set_idle(False)
+        super().finish()
+
+    def make_environ(self):
+        environ = super().make_environ()
+        self.keep_alive = (
+            self.request_version == 'HTTP/1.1'
+            and self.headers.get('Connection', '').lower() != 'close'
+            and 'Transfer-Encoding' not in self.headers
+        )
+        if self.keep_alive:
+            self.body = LimitedStream(self.rfile, int(environ.get('CONTENT_LENGTH') or 0))
+            environ['wsgi.input'] = self.body
+            self.socket_rfile, self.rfile = self.rfile, io.BytesIO()
+        return environ
+
+    def send_header(self, keyword: str, value: str) -> None:
+        if (self.keep_alive and keyword.lower() == 'connection' and value.lower() == 'close'
+                and not getattr(self.server, 'closing', False)):
+            value = 'keep-alive'
+        super().send_header(keyword, value)
+
+    def run_wsgi(self) -> None:
+        super().run_wsgi()
+        if self.keep_alive:
+            self.keep_alive = False
+            self.rfile = self.socket_rfile
+            try:
+                self.body.exhaust()
+            except OSError:
+                self.close_connection = True
+
+class PoolServer(ThreadedWSGIServer):
+    """
+    Threaded WSGI server that finishes in-flight requests before closing.
+
+    Connections waiting for their next keep-alive request are tracked, so
+    ``close_idle_connections`` can end them at once instead of letting
+    shutdown wait out their idle timeout. After that ``closing`` is set and
+    responses tell clients to close their connections.
+    """
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._idle: Set[socket.socket] = set()
+        self._idle_lock = threading.Lock()
+        self.closing = False
+
+    def set_idle(self, connection: socket.socket, idle: bool) -> None:
+        """Record whether a connection is between requests"""
+        with self._idle_lock:
+            if not idle:
+                self._idle.discard(connection)
+            elif self.closing:
+                self._end(connection)
+            else:
+                self._idle.add(connection)
+
+    def close_idle_connections(self) -> None:
+        """End idle keep-alive connections now, and busy ones once their response is sent"""
+        with self._idle_lock:
+            self.closing = True
+            for connection in self._idle:
+                self._end(connection)
+            self._idle.clear()
+
+    @staticmethod
+    def _end(connection: socket.socket) -> None:
+        # The handler's pending read returns end of file and it closes the connection
+        try:
+            connection.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the Survey Calculator API with a pool of worker processes.")
+    parser.add_argument('--host', default=os.environ.get('SURVEY_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=_env_int('SURVEY_PORT', 5000))
+    parser.add_argument('--workers', type=int, default=_env_int('SURVEY_WORKERS', os.cpu_count() or 1),
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument('--max-requests', type=int, default=_env_int('SURVEY_MAX_REQUESTS', 0),
+                        help="Recycle a worker after about this many requests, 0 to never recycle")
+    parser.add_argument('--graceful-timeout', type=int, default=_env_int('SURVEY_GRACEFUL_TIMEOUT', 30),
+                        help="Seconds workers get to finish in-flight requests on shutdown")
+    parser.add_argument('--keepalive', type=int, default=_env_int('SURVEY_KEEPALIVE', 5),
+                        help="Seconds an idle keep-alive connection stays open")
+    parser.add_argument('--backlog', type=int, default=_env_int('SURVEY_BACKLOG', 2048))
+    return parser.parse_args(argv)
+
+def run_worker(listener: socket.socket, config: argparse.Namespace, retire_fd: Optional[int] = None) -> None:
+    """
+    Serve the app from the shared socket until told to stop or recycled.
+
+    A worker that decides to recycle writes its pid to ``retire_fd``, so the
+    master can start its replacement while it finishes its requests.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the master decides when to stop
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+    from app import app, init_app, shutdown_services
+    from log_config import configure_logging, shutdown_logging
+    configure_logging(per_process=True)  # async rotation must not race other workers
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    init_app()
+
+    handler = type('WorkerRequestHandler', (KeepAliveRequestHandler,), {'timeout': config.keepalive})
+    server: Optional[PoolServer] = None
+    stopping = threading.Event()
+
+    def stop(*_args) -> None:
+        if not stopping.is_set():
+            stopping.set()
+            server.close_idle_connections()
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    wsgi_app = app
+    if config.max_requests:
+        # Jitter keeps workers started together from all retiring together
+        limit = config.max_requests + random.randint(0, max(config.max_requests // 10, 1))
+        served = itertools.count(1)
+
+        def wsgi_app(environ, start_response):
+            if next(served) == limit:
+                logger.info(f"Worker {os.getpid()} served {limit} requests, recycling")
+                if retire_fd is not None:
+                    os.write(retire_fd, _PID.pack(os.getpid()))
+                stop()
+            return app(environ, start_response)
+
+    server = PoolServer(config.host, config.port, wsgi_app, handler, fd=listener.fileno())
+    signal.signal(signal.SIGTERM, stop)
+    logger.info(f"Worker {os.getpid()} serving on {config.host}:{config.port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        # Workers leave through os._exit, which skips atexit
+        shutdown_services()
+        shutdown_logging()
+
+class Master:
+    """Supervise a pool of forked workers sharing one listening socket"""
+
+    def __init__(self, config: argparse.Namespace):
+        self.config = config
+        self.workers: Dict[int, float] = {}
+        self.retiring: Set[int] = set()
+        self.listener: Optional[socket.socket] = None
+        self._signals: List[int] = []
+        # Recycling workers announce themselves here
+        self._retire_read, self._retire_write = os.pipe()
+        os.set_blocking(self._retire_read, False)
+
+    def spawn_worker(self) -> None:
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return
+
+        status = 0
+        try:
+            os.close(self._retire_read)
+            run_worker(self.listener, self.config, self._retire_write)
+        except BaseException:
+            logger.exception(f"Worker {os.getpid()} failed")
+            status = 1
+        finally:
+            logging.shutdown()
+            os._exit(status)
+
+    def replace_retiring_workers(self) -> None:
+        """Start a replacement for every worker that announced it is recycling"""
+        try:
+            data = os.read(self._retire_read, _PID.size * 64)
+        except BlockingIOError:
+            return
+        for (pid,) in _PID.iter_unpack(data):
+            if pid in self.workers and pid not in self.retiring:
+                self.retiring.add(pid)
+                self.spawn_worker()
+
+    def reap_workers(self) -> None:
+        """Collect exited workers and start replacements"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            started = self.workers.pop(pid, None)
+            if started is None or pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            if code:
+                logger.warning(f"Worker {pid} exited with status {code}, restarting")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            self.spawn_worker()
+
+    def signal_workers(self, signum: int, pids: Optional[List[int]] = None) -> None:
+        for pid in list(self.workers) if pids is None else pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def stop(self) -> None:
+        """Ask every worker to finish in-flight requests, killing any that overrun the timeout"""
+        logger.info("Shutting down workers...")
+        self.signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + self.config.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.workers.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        if self.workers:
+            logger.warning(f"Killing {len(self.workers)} workers that did not stop in time")
+            self.signal_workers(signal.SIGKILL)
+            for pid in list(self.workers):
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            self.workers.clear()
+
+    def restart_workers(self) -> None:
+        """Replace every worker; old workers finish their requests while new ones start accepting"""
+        logger.info("Restarting workers...")
+        old = list(self.workers)
+        self.retiring.update(old)
+        for _ in range(self.config.workers):
+            self.spawn_worker()
+        self.signal_workers(signal.SIGTERM, old)
+
+    def run(self) -> None:
+        config = self.config
+        self.listener = socket.create_server((config.host, config.port), backlog=config.backlog)
+        logger.info(f"Listening on {config.host}:{config.port} with {config.workers} workers")
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, lambda signum, _frame: self._signals.append(signum))
+        for _ in range(config.workers):
+            self.spawn_worker()
+
+        try:
+            while True:
+                while self._signals:
+                    signum = self._signals.pop(0)
+                    if signum == signal.SIGHUP:
+                        self.restart_workers()
+                    else:
+                        return
+                self.replace_retiring_workers()
+                self.reap_workers()
+                select.select([self._retire_read], [], [], 0.2)
+        finally:
+            self.stop()
+            self.listener.close()
+            logger.info("Server stopped")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    config = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if not hasattr(os, 'fork'):
+        logger.warning("Process pools need os.fork; serving from a single process")
+        from app import app, init_app
+        from log_config import configure_logging
+        from werkzeug.serving import run_simple
+        configure_logging()
+        init_app()
+        run_simple(config.host, config.port, app, threaded=True)
+        return
+
+    Master(config).run()
+
+if __name__ == '__main__':
+    main()
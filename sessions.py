@@ -0,0 +1,423 @@
+"""
+Incremental survey sessions.
+
+A session holds the answers given so far, so clients can submit metrics
+one at a time and get back only the presets each answer changed. Its whole
+state is one compact record that doubles as its snapshot::
+
+    revision: u32 | metric keys digest: 8 bytes | metric count N: u8
+    | N x score: u8, in rule table order; 0xFF while unanswered
+
+The digest ties the record to the rule table's metrics; threshold changes
+keep sessions valid, but a table with different metrics invalidates them.
+
+``SessionStore`` keeps records in this process, in shards with their own
+lock and LRU order, bounded by count and idle TTL. ``SharedSessionStore``
+keeps them in a fixed-size memory-mapped table, so every worker process
+on the host sees the same sessions and they survive worker restarts.
+"""
+import hashlib
+import math
+import mmap
+import os
+import secrets
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, TypeVar, Union
+
+from batch_codec import MISSING_SCORE
+from preset_rules import PresetRuleTable
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+T = TypeVar('T')
+
+SESSION_TTL_SECONDS = 1800
+
+_RECORD = struct.Struct('<I8sB')  # revision, metric keys digest, metric count
+
+# Most metrics a record can describe, as its metric count is one byte
+MAX_SESSION_METRICS = 255
+
+_digests: Dict[tuple, bytes] = {}
+
+def keys_digest(table: PresetRuleTable) -> bytes:
+    """8-byte digest of the table's metric keys in order"""
+    digest = _digests.get(table.keys)
+    if digest is None:
+        digest = _digests[table.keys] = hashlib.blake2b('\0'.join(table.keys).encode('utf-8'),
+                                                        digest_size=8).digest()
+    return digest
+
+def new_session_id() -> str:
+    """Return a random session ID (32 hex characters)"""
+    return secrets.token_hex(16)
+
+def parse_session_id(session_id: str) -> Optional[bytes]:
+    """Return the 16 bytes of a session ID, or None if it is malformed"""
+    if len(session_id) != 32:
+        return None
+    try:
+        return bytes.fromhex(session_id)
+    except ValueError:
+        return None
+
+def new_record(table: PresetRuleTable) -> bytearray:
+    """Return the record of a session with no answers"""
+    return bytearray(_RECORD.pack(0, keys_digest(table), len(table))) + bytes((MISSING_SCORE,)) * len(table)
+
+def record_matches(record: bytes, table: PresetRuleTable) -> bool:
+    """Whether the record was made for the table's metrics"""
+    return record[4:12] == keys_digest(table)
+
+def record_revision(record: bytes) -> int:
+    """Number of updates that changed a score"""
+    return _RECORD.unpack_from(record)[0]
+
+def validate_answers(answers: Any, table: PresetRuleTable) -> Dict[str, Optional[int]]:
+    """
+    Check a mapping of metric to score, where None withdraws an answer.
+
+    Raises:
+        ValueError: If the body is not a mapping, a metric is unknown or a
+            score is not an integer from 0 to 100
+    """
+    if not isinstance(answers, dict):
+        raise ValueError("Request body must map each metric to a score")
+    for metric, score in answers.items():
+        if metric not in table:
+            raise ValueError(f"Unknown metric: {metric}")
+        if score is None:
+            continue
+        if isinstance(score, bool) or not isinstance(score, int):
+            raise ValueError(f"Invalid type for {metric}. Must be an integer or null")
+        if not 0 <= score <= 100:
+            raise ValueError(f"Invalid score for {metric}. Must be between 0-100")
+    return answers
+
+def apply_answers(record: bytearray, answers: Mapping[str, Optional[int]],
+                  table: PresetRuleTable) -> Dict[str, Optional[bytes]]:
+    """
+    Store validated answers and re-evaluate only the metrics they changed.
+
+    Returns:
+        Dict[str, Optional[bytes]]: For each metric whose preset changed,
+        its new pre-encoded JSON preset, or None if it is no longer selected
+    """
+    changed = {}
+    updated = False
+    for metric, score in answers.items():
+        position = _RECORD.size + table.index[metric]
+        new = MISSING_SCORE if score is None else score
+        old = record[position]
+        if new == old:
+            continue
+        record[position] = new
+        updated = True
+        rule = table.rules[position - _RECORD.size]
+        if rule.pass_table[new]:
+            changed[metric] = rule.fragments[new]
+        elif rule.pass_table[old]:
+            changed[metric] = None
+    if updated:
+        struct.pack_into('<I', record, 0, (record_revision(record) + 1) & 0xFFFFFFFF)
+    return changed
+
+def record_answers(record: bytes, table: PresetRuleTable) -> Dict[str, int]:
+    """Return the answered metrics and their scores"""
+    return {key: score for key, score in zip(table.keys, record[_RECORD.size:]) if score != MISSING_SCORE}
+
+def record_missing(record: bytes, table: PresetRuleTable) -> List[str]:
+    """Return the required metrics that are still unanswered"""
+    return [key for key in table.required if record[_RECORD.size + table.index[key]] == MISSING_SCORE]
+
+def _check_metric_count(table: PresetRuleTable, max_metrics: int) -> None:
+    if len(table) > max_metrics:
+        raise ValueError(f"Sessions hold at most {max_metrics} metrics, the presets define {len(table)}")
+
+class SessionStore:
+    """
+    Session records in this process, bounded by count and idle time.
+
+    Sessions are spread over shards that each have a lock and keep their
+    sessions in least-recently-used order. A session not touched for
+    ``ttl`` seconds expires; past ``max_sessions`` the least recently used
+    are dropped.
+    """
+
+    max_metrics = MAX_SESSION_METRICS
+
+    def __init__(self, max_sessions: int = 200000, ttl: float = SESSION_TTL_SECONDS, shards: int = 64):
+        self.ttl = ttl
+        self._shards: List[OrderedDict] = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._max_per_shard = max(max_sessions // shards, 1)
+
+    def check_table(self, table: PresetRuleTable) -> None:
+        """
+        Refuse a rule table whose records would not fit a session.
+
+        Raises:
+            ValueError: If the table has more metrics than a session can hold
+        """
+        _check_metric_count(table, self.max_metrics)
+
+    def _evict(self, sessions: OrderedDict, now: float) -> None:
+        while sessions:
+            expires = next(iter(sessions.values()))[0]
+            if expires > now and len(sessions) <= self._max_per_shard:
+                break
+            sessions.popitem(last=False)
+
+    def create(self, session_id: bytes, record: bytes) -> None:
+        """Add a session"""
+        index = hash(session_id) % len(self._shards)
+        sessions = self._shards[index]
+        now = time.monotonic()
+        with self._locks[index]:
+            sessions[session_id] = [now + self.ttl, bytearray(record)]
+            sessions.move_to_end(session_id)
+            self._evict(sessions, now)
+
+    def modify(self, session_id: bytes, fn: Callable[[bytearray], T]) -> Optional[T]:
+        """
+        Call ``fn`` with the session's record, which it may change in place,
+        while no other thread can touch the session; this renews the TTL.
+
+        Returns:
+            Optional[T]: What ``fn`` returned, or None if there is no such
+            live session
+        """
+        index = hash(session_id) % len(self._shards)
+        sessions = self._shards[index]
+        now = time.monotonic()
+        with self._locks[index]:
+            entry = sessions.get(session_id)
+            if entry is None or entry[0] <= now:
+                return None
+            entry[0] = now + self.ttl
+            sessions.move_to_end(session_id)
+            return fn(entry[1])
+
+    def snapshot(self, session_id: bytes) -> Optional[bytes]:
+        """Return a copy of the session's record, renewing its TTL"""
+        return self.modify(session_id, bytes)
+
+    def delete(self, session_id: bytes) -> Optional[bytes]:
+        """Remove a session, returning its last record if it was live"""
+        index = hash(session_id) % len(self._shards)
+        with self._locks[index]:
+            entry = self._shards[index].pop(session_id, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return bytes(entry[1])
+
+    def pop_if(self, session_id: bytes, predicate: Callable[[bytes], bool]) -> Optional[Tuple[bool, bytes]]:
+        """
+        Remove the session if ``predicate`` holds for its record, checking
+        and removing while no other thread can touch the session; a session
+        that stays has its TTL renewed.
+
+        Returns:
+            Optional[Tuple[bool, bytes]]: Whether the session was removed and
+            the record ``predicate`` saw, or None if there is no such live
+            session
+        """
+        index = hash(session_id) % len(self._shards)
+        sessions = self._shards[index]
+        now = time.monotonic()
+        with self._locks[index]:
+            entry = sessions.get(session_id)
+            if entry is None or entry[0] <= now:
+                return None
+            record = bytes(entry[1])
+            if predicate(record):
+                del sessions[session_id]
+                return True, record
+            entry[0] = now + self.ttl
+            sessions.move_to_end(session_id)
+            return False, record
+
+    def __len__(self) -> int:
+        return sum(len(sessions) for sessions in self._shards)
+
+class SharedSessionStore:
+    """
+    Session records in a memory-mapped file shared by every process on the host.
+
+    The file is a fixed-size table of ``sets`` x ``ways`` slots, each large
+    enough for a record of up to ``max_metrics`` metrics. A session lives
+    in the set picked by its ID; a new one takes an empty or expired slot,
+    or else the least recently used one. Sets are locked with ``fcntl``
+    record locks against other processes and thread locks against other
+    threads of this process. Expiry uses the wall clock, because the file
+    can outlive the processes and the host's uptime.
+    """
+
+    MAGIC = b'SVSS0001'
+    _HEADER = struct.Struct('<8sIII')  # magic, sets, ways, max metrics
+    _SLOT = struct.Struct('<16sdB')  # session ID, expiry, record length (0 when empty)
+
+    def __init__(self, path: Union[str, os.PathLike], ttl: float = SESSION_TTL_SECONDS,
+                 sets: int = 32768, ways: int = 8, max_metrics: int = 64, locks: int = 64):
+        if fcntl is None:
+            raise ValueError("The shared session store needs fcntl, which is not available on this platform")
+        if not 0 < max_metrics <= 255 - _RECORD.size:  # slots store the record length in one byte
+            raise ValueError(f"Shared session slots hold between 1 and {255 - _RECORD.size} metrics")
+        self.ttl = ttl
+        self.sets = sets
+        self.ways = ways
+        self.max_metrics = max_metrics
+        self._slot_size = self._SLOT.size + _RECORD.size + max_metrics
+        self._set_size = self._slot_size * ways
+        size = self._HEADER.size + self._set_size * sets
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self._HEADER.size, 0)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, self._HEADER.pack(self.MAGIC, sets, ways, max_metrics), 0)
+            header = self._HEADER.unpack(os.pread(self._fd, self._HEADER.size, 0))
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self._HEADER.size, 0)
+        if header != (self.MAGIC, sets, ways, max_metrics):
+            os.close(self._fd)
+            raise ValueError(f"{path} is not a session table with {sets} sets of {ways} "
+                             f"slots for {max_metrics} metrics")
+
+        self._map = mmap.mmap(self._fd, size)
+        self._locks = [threading.Lock() for _ in range(locks)]
+
+    def check_table(self, table: PresetRuleTable) -> None:
+        """
+        Refuse a rule table whose records would not fit a slot.
+
+        Raises:
+            ValueError: If the table has more metrics than a slot holds
+        """
+        _check_metric_count(table, self.max_metrics)
+
+    def _locked(self, session_id: bytes, fn: Callable[[int], T]) -> T:
+        """Call ``fn`` with the offset of the session's set while holding its locks"""
+        set_index = int.from_bytes(session_id[:8], 'little') % self.sets
+        offset = self._HEADER.size + set_index * self._set_size
+        with self._locks[set_index % len(self._locks)]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self._set_size, offset)
+            try:
+                return fn(offset)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self._set_size, offset)
+
+    def _find(self, offset: int, session_id: bytes, now: float) -> Optional[int]:
+        for slot in range(offset, offset + self._set_size, self._slot_size):
+            slot_id, expires, length = self._SLOT.unpack_from(self._map, slot)
+            if length and slot_id == session_id and expires > now:
+                return slot
+        return None
+
+    def _read(self, slot: int) -> bytearray:
+        length = self._map[slot + self._SLOT.size - 1]
+        start = slot + self._SLOT.size
+        return bytearray(self._map[start:start + length])
+
+    def _write(self, slot: int, session_id: bytes, expires: float, record: bytes) -> None:
+        self._SLOT.pack_into(self._map, slot, session_id, expires, len(record))
+        start = slot + self._SLOT.size
+        self._map[start:start + len(record)] = record
+
+    def create(self, session_id: bytes, record: bytes) -> None:
+        """
+        Add a session.
+
+        Raises:
+            ValueError: If the record has more metrics than a slot holds
+        """
+        if len(record) > _RECORD.size + self.max_metrics:
+            raise ValueError(f"Sessions in {self.max_metrics}-metric slots cannot hold {len(record)}-byte records")
+
+        def insert(offset: int) -> None:
+            now = time.time()
+            victim, victim_expires = offset, math.inf
+            for slot in range(offset, offset + self._set_size, self._slot_size):
+                _, expires, length = self._SLOT.unpack_from(self._map, slot)
+                if not length or expires <= now:
+                    victim = slot
+                    break
+                if expires < victim_expires:
+                    victim, victim_expires = slot, expires
+            self._write(victim, session_id, now + self.ttl, record)
+
+        self._locked(session_id, insert)
+
+    def modify(self, session_id: bytes, fn: Callable[[bytearray], T]) -> Optional[T]:
+        """
+        Call ``fn`` with the session's record, which it may change in place,
+        while no other thread or process can touch the session; this renews
+        the TTL.
+
+        Returns:
+            Optional[T]: What ``fn`` returned, or None if there is no such
+            live session
+        """
+        def update(offset: int) -> Optional[T]:
+            now = time.time()
+            slot = self._find(offset, session_id, now)
+            if slot is None:
+                return None
+            record = self._read(slot)
+            result = fn(record)
+            self._write(slot, session_id, now + self.ttl, record)
+            return result
+
+        return self._locked(session_id, update)
+
+    def snapshot(self, session_id: bytes) -> Optional[bytes]:
+        """Return a copy of the session's record, renewing its TTL"""
+        return self.modify(session_id, bytes)
+
+    def delete(self, session_id: bytes) -> Optional[bytes]:
+        """Remove a session, returning its last record if it was live"""
+        def remove(offset: int) -> Optional[bytes]:
+            slot = self._find(offset, session_id, time.time())
+            if slot is None:
+                return None
+            record = bytes(self._read(slot))
+            self._SLOT.pack_into(self._map, slot, bytes(16), 0.0, 0)
+            return record
+
+        return self._locked(session_id, remove)
+
+    def pop_if(self, session_id: bytes, predicate: Callable[[bytes], bool]) -> Optional[Tuple[bool, bytes]]:
+        """
+        Remove the session if ``predicate`` holds for its record, checking
+        and removing while no other thread or process can touch the
+        session; a session that stays has its TTL renewed.
+
+        Returns:
+            Optional[Tuple[bool, bytes]]: Whether the session was removed and
+            the record ``predicate`` saw, or None if there is no such live
+            session
+        """
+        def pop(offset: int) -> Optional[Tuple[bool, bytes]]:
+            now = time.time()
+            slot = self._find(offset, session_id, now)
+            if slot is None:
+                return None
+            record = bytes(self._read(slot))
+            if predicate(record):
+                self._SLOT.pack_into(self._map, slot, bytes(16), 0.0, 0)
+                return True, record
+            self._write(slot, session_id, now + self.ttl, record)
+            return False, record
+
+        return self._locked(session_id, pop)
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
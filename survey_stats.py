@@ -0,0 +1,403 @@
+"""
+Live aggregate statistics over scored surveys.
+
+Scores are integers from 0 to 100, so a 101-bin histogram per metric is an
+exact, mergeable quantile sketch: updates are O(1), quantiles and
+percentile ranks are read from cumulative counts, and aggregates from
+several processes combine by adding bins. Aggregates are kept all-time and
+per fixed time window.
+
+Usage:
+    python survey_stats.py results/    # rebuild aggregates from a result store
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+from preset_rules import PresetRuleTable
+
+logger = logging.getLogger(__name__)
+
+SCORE_BINS = 101
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+_EMPTY_HISTOGRAM = array('Q', bytes(8 * SCORE_BINS))
+
+class Aggregate:
+    """Survey count, per-metric score histograms and per-metric preset hits"""
+    __slots__ = ('surveys', 'histograms', 'hits')
+
+    def __init__(self):
+        self.surveys = 0
+        self.histograms: Dict[str, array] = {}
+        self.hits: Dict[str, int] = {}
+
+    def histogram(self, metric: str) -> array:
+        histogram = self.histograms.get(metric)
+        if histogram is None:
+            histogram = self.histograms[metric] = array('Q', bytes(8 * SCORE_BINS))
+        return histogram
+
+    def add(self, user_metrics: Dict[str, int], hit_metrics: Iterable[str]) -> None:
+        self.surveys += 1
+        for metric, score in user_metrics.items():
+            self.histogram(metric)[score] += 1
+        for metric in hit_metrics:
+            self.hits[metric] = self.hits.get(metric, 0) + 1
+
+    def merge(self, other: Dict[str, Any]) -> None:
+        """Add a snapshot produced by ``to_dict``"""
+        self.surveys += other['surveys']
+        for metric, counts in other['histograms'].items():
+            histogram = self.histogram(metric)
+            for score, count in enumerate(counts):
+                histogram[score] += count
+        for metric, count in other['hits'].items():
+            self.hits[metric] = self.hits.get(metric, 0) + count
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'surveys': self.surveys,
+            'histograms': {metric: histogram.tolist() for metric, histogram in self.histograms.items()},
+            'hits': dict(self.hits)
+        }
+
+def quantile(histogram: array, q: float) -> Optional[int]:
+    """Return the smallest score with at least ``q`` of the observations at or below it"""
+    total = sum(histogram)
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for score, count in enumerate(histogram):
+        seen += count
+        if seen >= target and seen:
+            return score
+    return SCORE_BINS - 1
+
+def percentile_rank(histogram: array, score: int) -> Optional[float]:
+    """Return the percentage of observations below ``score``, counting ties as half"""
+    total = sum(histogram)
+    if not total:
+        return None
+    below = sum(histogram[:score])
+    return round(100.0 * (below + 0.5 * histogram[score]) / total, 2)
+
+class SurveyStats:
+    """
+    Thread-safe running aggregates, all-time and bucketed by time window.
+
+    Only the most recent ``max_windows`` windows are kept.
+    """
+
+    def __init__(self, window_seconds: int = 3600, max_windows: int = 48):
+        self.window_seconds = window_seconds
+        self.max_windows = max_windows
+        self.totals = Aggregate()
+        self.windows: Dict[int, Aggregate] = {}
+        self._lock = threading.Lock()
+
+    def _window(self, window_start: int) -> Aggregate:
+        window = self.windows.get(window_start)
+        if window is None:
+            window = self.windows[window_start] = Aggregate()
+            while len(self.windows) > self.max_windows:
+                del self.windows[min(self.windows)]
+        return window
+
+    def record(self, user_metrics: Dict[str, int], table: PresetRuleTable,
+               timestamp: Optional[float] = None) -> None:
+        """
+        Add one validated survey to the aggregates.
+
+        Args:
+            user_metrics (Dict[str, int]): Scores keyed by metric
+            table (PresetRuleTable): Rule table the survey was scored against
+            timestamp (Optional[float]): Epoch seconds, defaults to now
+        """
+        hit_metrics = [metric for metric, score in user_metrics.items()
+                       if score >= table.get(metric).threshold]
+        self._add(user_metrics, hit_metrics, time.time() if timestamp is None else timestamp)
+
+    def record_packed(self, columns: Dict[str, bytes], hits: Dict[str, bytes], surveys: int,
+                      timestamp: Optional[float] = None) -> None:
+        """
+        Add many validated surveys given as packed columns.
+
+        Histograms are filled with one ``bytes.count`` per score value, so
+        no Python code runs per survey.
+
+        Args:
+            columns (Dict[str, bytes]): One score byte per survey for each
+                metric; bytes above 100 mark surveys without that score
+            hits (Dict[str, bytes]): 1 where the score met the metric's
+                threshold, aligned with ``columns``
+            surveys (int): Number of surveys the columns describe
+            timestamp (Optional[float]): Epoch seconds, defaults to now
+        """
+        counts = {
+            'surveys': surveys,
+            'histograms': {metric: [column.count(score) for score in range(SCORE_BINS)]
+                           for metric, column in columns.items()},
+            'hits': {metric: column.count(1) for metric, column in hits.items()}
+        }
+        timestamp = time.time() if timestamp is None else timestamp
+        window_start = int(timestamp) // self.window_seconds * self.window_seconds
+        with self._lock:
+            self.totals.merge(counts)
+            self._window(window_start).merge(counts)
+
+    def _add(self, user_metrics: Dict[str, int], hit_metrics: List[str], timestamp: float) -> None:
+        window_start = int(timestamp) // self.window_seconds * self.window_seconds
+        with self._lock:
+            self.totals.add(user_metrics, hit_metrics)
+            self._window(window_start).add(user_metrics, hit_metrics)
+
+    def percentile_ranks(self, user_metrics: Dict[str, int]) -> Dict[str, Optional[float]]:
+        """
+        Return each submitted score's percentile rank among the scores
+        recorded by this process, not those of its sibling workers
+        """
+        return {
+            metric: percentile_rank(self.totals.histograms.get(metric, _EMPTY_HISTOGRAM), score)
+            for metric, score in user_metrics.items()
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serializable copy of the aggregates"""
+        with self._lock:
+            return {
+                'window_seconds': self.window_seconds,
+                'totals': self.totals.to_dict(),
+                'windows': {str(start): window.to_dict() for start, window in self.windows.items()}
+            }
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        """
+        Add aggregates from another process's ``snapshot``.
+
+        Raises:
+            ValueError: If the snapshot uses a different window size
+        """
+        if snapshot['window_seconds'] != self.window_seconds:
+            raise ValueError("Cannot merge statistics with a different window size")
+        with self._lock:
+            self.totals.merge(snapshot['totals'])
+            for start, window in snapshot['windows'].items():
+                self._window(int(start)).merge(window)
+
+    def summary(self, table: PresetRuleTable, window_count: int = 24,
+                quantiles: Iterable[float] = DEFAULT_QUANTILES) -> Dict[str, Any]:
+        """
+        Summarize hit rates and score quantiles for reporting.
+
+        Args:
+            table (PresetRuleTable): Rule table naming the metrics to report
+            window_count (int): Number of most recent windows to include
+            quantiles (Iterable[float]): Quantiles to report, between 0 and 1
+
+        Returns:
+            Dict[str, Any]: All-time and per-window summaries
+        """
+        quantiles = tuple(quantiles)
+
+        def describe(aggregate: Aggregate) -> Dict[str, Any]:
+            metrics = {}
+            for rule in table.rules:
+                histogram = aggregate.histograms.get(rule.key, _EMPTY_HISTOGRAM)
+                hits = aggregate.hits.get(rule.key, 0)
+                metrics[rule.key] = {
+                    'name': rule.name,
+                    'preset': rule.preset,
+                    'responses': sum(histogram),
+                    'hits': hits,
+                    'hit_rate': round(hits / aggregate.surveys, 4) if aggregate.surveys else None,
+                    'quantiles': {f'p{q * 100:g}': quantile(histogram, q) for q in quantiles}
+                }
+            return {'surveys': aggregate.surveys, 'metrics': metrics}
+
+        with self._lock:
+            recent = sorted(self.windows)[-window_count:] if window_count > 0 else []
+            summary = describe(self.totals)
+            summary['window_seconds'] = self.window_seconds
+            summary['windows'] = [
+                dict(start=datetime.fromtimestamp(start).isoformat(), **describe(self.windows[start]))
+                for start in recent
+            ]
+        return summary
+
+    def rebuild(self, results: Iterable[Dict[str, Any]], table: PresetRuleTable) -> int:
+        """
+        Add persisted results, shaped like ``save_results`` output.
+
+        Preset hits are taken from each result's stored presets, matched to
+        metrics by name, so they reflect the thresholds in force at the time.
+
+        Returns:
+            int: Number of results added
+        """
+        keys_by_name = {rule.name: rule.key for rule in table.rules}
+        count = 0
+        for result in results:
+            hit_metrics = [keys_by_name[preset['name']] for preset in result['selected_presets']
+                           if preset['name'] in keys_by_name]
+            timestamp = datetime.fromisoformat(result['timestamp']).timestamp()
+            self._add(result['user_metrics'], hit_metrics, timestamp)
+            count += 1
+        return count
+
+class StatsPublisher:
+    """
+    Share one process's aggregates with its sibling worker processes.
+
+    Every ``interval`` seconds the local snapshot is written atomically to
+    ``stats-<pid>-<nonce>.json`` in a shared directory, the nonce telling
+    apart processes that reuse a pid; ``merged`` combines the live local
+    aggregates with every other process's latest snapshot and the archive.
+    A process that stops folds its snapshot into ``stats-archive.json`` and
+    removes it, and ``merged`` does the same for processes that died without
+    stopping, so the directory holds one file per live process. Folding is
+    serialized with an ``fcntl`` lock on ``stats.lock``; where ``fcntl`` is
+    not available snapshots are left in place instead.
+    """
+
+    ARCHIVE = 'stats-archive.json'
+    _SNAPSHOT = re.compile(r'stats-(\d+)-[0-9a-f]+\.json')
+
+    def __init__(self, stats: SurveyStats, directory: Union[str, Path], interval: float = 5.0):
+        self.stats = stats
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.interval = interval
+        self.path = self.directory / f'stats-{os.getpid()}-{os.urandom(4).hex()}.json'
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stats-publisher', daemon=True)
+        self._thread.start()
+
+    def publish(self) -> None:
+        self._write(self.path, self.stats.snapshot())
+
+    def merged(self) -> SurveyStats:
+        dead = [path for path in self._snapshots() if not self._alive(path)]
+        if dead:
+            with self._locked(fcntl.LOCK_EX if fcntl else 0):
+                self._fold(dead)
+
+        merged = SurveyStats(self.stats.window_seconds, self.stats.max_windows)
+        merged.merge(self.stats.snapshot())
+        with self._locked(fcntl.LOCK_SH if fcntl else 0):
+            for path in [self.directory / self.ARCHIVE] + self._snapshots():
+                try:
+                    with open(path) as f:
+                        merged.merge(json.load(f))
+                except FileNotFoundError:
+                    continue
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping statistics snapshot %s: %s", path, e)
+        return merged
+
+    def stop(self) -> None:
+        """Stop publishing and fold this process's aggregates into the archive"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join()  # a publish after the fold would count this process twice
+        if fcntl is None:
+            self.publish()
+            return
+        with self._locked(fcntl.LOCK_EX):
+            self._fold([], self.stats.snapshot())
+
+    def _snapshots(self) -> List[Path]:
+        return [path for path in self.directory.glob('stats-*.json')
+                if path != self.path and self._SNAPSHOT.fullmatch(path.name)]
+
+    def _alive(self, path: Path) -> bool:
+        if fcntl is None:
+            return True
+        try:
+            os.kill(int(self._SNAPSHOT.fullmatch(path.name).group(1)), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @contextmanager
+    def _locked(self, operation: int) -> Iterator[None]:
+        if not operation:
+            yield
+            return
+        with open(self.directory / 'stats.lock', 'a') as lock:
+            fcntl.flock(lock, operation)
+            yield
+
+    def _fold(self, dead: List[Path], own: Optional[Dict[str, Any]] = None) -> None:
+        """Merge dead processes' snapshots, and ``own``, into the archive; needs the exclusive lock"""
+        archive = SurveyStats(self.stats.window_seconds, self.stats.max_windows)
+        archive_path = self.directory / self.ARCHIVE
+        folded = []
+        for path in [archive_path] + [path for path in dead if path.exists()]:
+            try:
+                with open(path) as f:
+                    archive.merge(json.load(f))
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                logger.warning("Skipping statistics snapshot %s: %s", path, e)
+                continue
+            if path != archive_path:
+                folded.append(path)
+        if own is not None:
+            archive.merge(own)
+        if not folded and own is None:
+            return
+        self._write(archive_path, archive.snapshot())
+        for path in folded + ([self.path] if own is not None else []):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _write(path: Path, snapshot: Dict[str, Any]) -> None:
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.publish()
+            except OSError as e:
+                logger.error("Failed to publish statistics: %s", e)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Rebuild aggregates from a result store and print the summary as JSON"""
+    from evaluator import get_rule_table
+    from result_store import ResultStoreReader
+
+    argv = sys.argv[1:] if argv is None else argv
+    directory = argv[0] if argv else os.environ.get('SURVEY_RESULTS_DIR', 'results')
+    table = get_rule_table()
+    stats = SurveyStats()
+    count = stats.rebuild(ResultStoreReader(directory).iter_results(), table)
+    print(f"Rebuilt statistics from {count} results in {directory}", file=sys.stderr)
+    print(json.dumps(stats.summary(table), indent=4))
+
+if __name__ == '__main__':
+    main()
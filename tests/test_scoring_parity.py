@@ -0,0 +1,83 @@
+"""
+Parity of ``scoring`` with the survey page's own scoring.
+
+Every combination of answers the form allows, leaving any radio group
+unanswered, is scored in Python and compared bit for bit with
+``calculateMetrics`` from ``index.html``: run under node when it is
+installed, otherwise through a digest of its output stored below.
+"""
+import hashlib
+import itertools
+import json
+import re
+import shutil
+import struct
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from scoring import FREQUENCY_OPTIONS, INFO_CHARACTERISTICS, SURVEY_METRICS, score_answers_batch
+
+INDEX_HTML = Path(__file__).resolve().parent.parent / 'index.html'
+
+# SHA-256 of the float64 scores calculateMetrics returns for every case of
+# all_cases(), in order; regenerate with node if the page's scoring changes
+JS_SCORES_SHA256 = '978a664c58add751b5921e977a112a6f911a08f663286f13dd6e1253f53ff07b'
+
+def all_cases():
+    """Form data as gatherFormData builds it: unanswered radios are absent, checkboxes always a list"""
+    for familiarity, cross_check, experience, checked in itertools.product(
+            (None,) + FREQUENCY_OPTIONS, (None,) + FREQUENCY_OPTIONS, (None, 'yes', 'no'),
+            itertools.product((False, True), repeat=len(INFO_CHARACTERISTICS))):
+        form = {'info_characteristics': [c for c, on in zip(INFO_CHARACTERISTICS, checked) if on]}
+        for key, value in (('llm_familiarity', familiarity), ('cross_check_frequency', cross_check),
+                           ('llm_experience', experience)):
+            if value is not None:
+                form[key] = str(value)
+        yield form
+
+def python_scores(cases):
+    results = score_answers_batch(cases)
+    assert all(result['success'] for result in results)
+    return [[result['scores'][metric] for metric in SURVEY_METRICS] for result in results]
+
+def encode(scores):
+    return b''.join(struct.pack('<%dd' % len(row), *row) for row in scores)
+
+def page_scoring_script():
+    """The page's surveyMetrics and calculate* functions, as a script for node"""
+    html = INDEX_HTML.read_text(encoding='utf-8')
+    metrics = re.search(r'const surveyMetrics = \{.*?\n        \};', html, re.S).group(0)
+    functions = re.search(r'function calculateMetrics\(.*?(?=\n        function displayResults)', html, re.S).group(0)
+    return metrics + '\n' + functions + '''
+let input = '';
+process.stdin.on('data', chunk => input += chunk);
+process.stdin.on('end', () => {
+    const rows = JSON.parse(input).map(form => {
+        const metrics = calculateMetrics(form);
+        return Object.keys(surveyMetrics).map(metric => metrics[metric]);
+    });
+    process.stdout.write(JSON.stringify(rows));
+});
+'''
+
+def test_all_cases_are_covered():
+    cases = list(all_cases())
+    assert len(cases) == 6 * 6 * 3 * 2 ** len(INFO_CHARACTERISTICS)
+    assert {'info_characteristics': []} in cases
+
+def test_matches_stored_page_scores():
+    assert hashlib.sha256(encode(python_scores(list(all_cases())))).hexdigest() == JS_SCORES_SHA256
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="node is not installed")
+def test_matches_page_scoring_under_node():
+    cases = list(all_cases())
+    completed = subprocess.run(['node', '-e', page_scoring_script()], input=json.dumps(cases),
+                               capture_output=True, text=True, check=True)
+    js = json.loads(completed.stdout)
+
+    mismatches = [(form, expected, actual) for form, expected, actual in zip(cases, js, python_scores(cases))
+                  if encode([expected]) != encode([actual])]
+    assert not mismatches, f"{len(mismatches)} of {len(cases)} differ, first: {mismatches[0]}"
+    assert hashlib.sha256(encode(js)).hexdigest() == JS_SCORES_SHA256
@@ -0,0 +1,16 @@
+"""
+Cold starts stay within their budget and leave no files behind.
+
+Each scenario runs in fresh interpreters, so this takes a few seconds and
+is marked slow.
+"""
+import pytest
+
+from benchmarks.startup import SCENARIOS, check_budget, run_startup
+
+@pytest.mark.slow
+def test_startup_within_budget():
+    results = run_startup(runs=3)
+    assert set(results) == {f'startup.{name}' for name in SCENARIOS}
+    assert check_budget(results) == []
+    assert all(result['files_created'] == 0 for result in results.values())